@@ -10,5 +10,9 @@ class ChatMessage(db.Model):
 
     user = db.relationship('User', backref=db.backref('chat_messages', lazy='dynamic'))
 
+    __table_args__ = (
+        db.Index('ix_chat_message_user_id_id', 'user_id', 'id'),
+    )
+
     def __repr__(self):
         return f'<ChatMessage {self.id}>'
\ No newline at end of file
@@ -0,0 +1,17 @@
+from app import db
+from sqlalchemy.sql import func
+
+class ChatSummary(db.Model):
+    """Rolling summary of the chatbot messages that have left a user's context window."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), unique=True, nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    # Last ChatMessage folded into the summary; newer messages are sent verbatim
+    last_message_id = db.Column(db.Integer, nullable=False)
+    token_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    user = db.relationship('User', backref=db.backref('chat_summary', uselist=False))
+
+    def __repr__(self):
+        return f'<ChatSummary {self.user_id}>'
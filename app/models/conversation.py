@@ -0,0 +1,27 @@
+from app import db
+
+class Conversation(db.Model):
+    """
+    One row per gynecologist/patient pair, kept up to date by save_message so
+    the inbox is read without aggregating GynecologistMessage.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    gynecologist_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    patient_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    last_message_id = db.Column(db.Integer, db.ForeignKey('gynecologist_message.id'), nullable=False)
+    last_message_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    # Messages the other side has not read yet
+    unread_by_gynecologist = db.Column(db.Integer, nullable=False, default=0)
+    unread_by_patient = db.Column(db.Integer, nullable=False, default=0)
+
+    patient = db.relationship('User', foreign_keys=[patient_id])
+    gynecologist = db.relationship('User', foreign_keys=[gynecologist_id])
+    last_message = db.relationship('GynecologistMessage')
+
+    __table_args__ = (
+        db.UniqueConstraint('gynecologist_id', 'patient_id', name='uq_conversation_gynecologist_id_patient_id'),
+        db.Index('ix_conversation_gynecologist_id_last_message_at', 'gynecologist_id', 'last_message_at'),
+    )
+
+    def __repr__(self):
+        return f'<Conversation {self.gynecologist_id}-{self.patient_id}>'
@@ -14,6 +14,10 @@ class GynecologistMessage(db.Model):
     patient = db.relationship('User', foreign_keys=[patient_id], backref='patient_messages')
     gynecologist = db.relationship('User', foreign_keys=[gynecologist_id], backref='gynecologist_messages')
 
+    __table_args__ = (
+        db.Index('ix_gynecologist_message_gynecologist_id_patient_id_read', 'gynecologist_id', 'patient_id', 'read'),
+    )
+
     def __repr__(self):
         return f'<GynecologistMessage {self.id}>'
     @property
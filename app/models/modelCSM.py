@@ -1,13 +1,27 @@
 import torch
 import torch.nn as nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+# Branches each output stage depends on, besides stage1
+STAGE_BRANCHES = {
+    1: (),
+    2: ('f1', 'f2', 'stage2'),
+    3: ('f1', 'f2', 'f3', 'up', 'stage2', 'stage3'),
+}
 
 class CSM(nn.Module):
     """
     Convolutional segmentation machine.
+
+    `output_stage` selects the last stage computed by forward(); the outputs
+    of stages 1..output_stage are returned and later stages are skipped.
     """
 
-    def __init__(self):
+    def __init__(self, output_stage=3):
         super(CSM, self).__init__()
+        if output_stage not in STAGE_BRANCHES:
+            raise ValueError(f"output_stage must be one of {sorted(STAGE_BRANCHES)}")
+        self.output_stage = output_stage
         self.stage1 = nn.Sequential(nn.Conv2d(1, 8, 9, padding=4),
                                    nn.BatchNorm2d(8),
                                    nn.ReLU(True),
@@ -66,19 +80,35 @@ class CSM(nn.Module):
 
     def forward(self, x):
         y1 = self.stage1(x)
-        x_f1 = self.f1(x)
+        if self.output_stage == 1:
+            return (y1,)
 
+        x_f1 = self.f1(x)
         x_f2 = self.f2(x_f1)
-        x_f3 = self.f3(x_f1)
 
         x1 = torch.cat([y1, x_f2], 1)
         y2 = self.stage2(x1)
+        if self.output_stage == 2:
+            return y1, y2
+
+        x_f3 = self.f3(x_f1)
         y2_up = self.up(y2)
         x2 = torch.cat([y2_up, x_f3], 1)
         y3 = self.stage3(x2)
 
         return y1, y2, y3
 
+    def prune(self):
+        """
+        Removes the branches the selected output stage never uses.
+        Call after load_state_dict(), since the pruned model no longer
+        matches the full checkpoint.
+        """
+        for name in STAGE_BRANCHES[3]:
+            if name not in STAGE_BRANCHES[self.output_stage]:
+                delattr(self, name)
+        return self
+
 class CSM_stagen(nn.Module):
     """
     Network of n(n>=2) stage in CSM.
@@ -106,3 +136,61 @@ class CSM_stagen(nn.Module):
     def forward(self, x):
         x = self.conv(x)
         return x
+
+
+def fuse_conv_bn(module):
+    """
+    Folds every BatchNorm2d that directly follows a Conv2d inside an
+    nn.Sequential into that convolution. The module must be in eval mode.
+    """
+    for child in module.children():
+        fuse_conv_bn(child)
+
+    if isinstance(module, nn.Sequential):
+        for i in range(len(module) - 1):
+            if isinstance(module[i], nn.Conv2d) and isinstance(module[i + 1], nn.BatchNorm2d):
+                module[i] = fuse_conv_bn_eval(module[i], module[i + 1])
+                module[i + 1] = nn.Identity()
+    return module
+
+
+def optimize_for_inference(model):
+    """Prunes unused stages and fuses BatchNorm layers of a loaded CSM in place."""
+    model.eval()
+    model.prune()
+    fuse_conv_bn(model)
+    return model
+
+
+def export_inference_graph(model, path, format='torchscript', input_size=(128, 192)):
+    """
+    Exports an optimized CSM to TorchScript or ONNX.
+
+    Args:
+        model (CSM): A loaded model, usually passed through optimize_for_inference().
+        path (str): Destination file.
+        format (str): 'torchscript' or 'onnx'.
+        input_size (tuple): (height, width) of the grayscale input.
+    """
+    model.eval()
+    example = torch.zeros(1, 1, *input_size)
+    output_names = [f'y{stage}' for stage in range(1, model.output_stage + 1)]
+
+    with torch.no_grad():
+        if format == 'torchscript':
+            traced = torch.jit.freeze(torch.jit.trace(model, example))
+            traced.save(path)
+        elif format == 'onnx':
+            try:
+                torch.onnx.export(
+                    model, example, path,
+                    input_names=['image'],
+                    output_names=output_names,
+                    dynamic_axes={name: {0: 'batch'} for name in ['image'] + output_names},
+                    opset_version=17
+                )
+            except ImportError as e:
+                raise RuntimeError(f"ONNX export needs the onnx and onnxscript packages: {e}") from e
+        else:
+            raise ValueError(f"Unsupported export format: {format}")
+    return path
@@ -0,0 +1,18 @@
+from app import db
+from sqlalchemy.sql import func
+
+class ReportJob(db.Model):
+    id = db.Column(db.String(32), primary_key=True)
+    status = db.Column(db.String(16), nullable=False, default='queued', index=True)
+    # Uploaded image, kept until the job finishes so it can be retried after a restart
+    image = db.Column(db.LargeBinary, nullable=True)
+    report_html = db.Column(db.Text, nullable=True)
+    pdf_filename = db.Column(db.String(255), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=func.now())
+    started_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    finished_at = db.Column(db.DateTime(timezone=True), nullable=True)
+
+    def __repr__(self):
+        return f'<ReportJob {self.id} {self.status}>'
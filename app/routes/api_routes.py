@@ -1,20 +1,30 @@
-from flask import Blueprint, jsonify, request, send_file, url_for
+from flask import Blueprint, Response, jsonify, request, send_file, stream_with_context, url_for
 import os
 import json
+import math
+import time
 from bs4 import BeautifulSoup
 from threading import Thread
-from app.services.ultrasound_classification_service import classify_image
-from app.services.report_generation_service import create_report
-from app.services.chatbot_service import get_chatbot_response, clear_conversation_history, get_conversation_history
-from app.services.image_enhancement_service import enhance_image
+from itertools import chain
+from app.services.ultrasound_classification_service import classify_image, classify_images, CLASSIFIER_MAX_FRAMES, CLASSIFIER_MODEL_VERSION
+from app.services.report_generation_service import create_report_from_bytes, generate_pdf, report_pdf_file
+from app.services.report_job_service import submit_report_job, get_report_job
+from app.services.chatbot_service import get_chatbot_response, stream_chatbot_response, clear_conversation_history, get_conversation_history
+from app.services.image_enhancement_service import enhance_image, enhance_image_tiled, ENHANCEMENT_MODEL_VERSION
 from app.services.head_circumference_service import *
-from app.services.Smart_reminders_service import text_to_events
+from app.services.Smart_reminders_service import extract_events
 from app.services.story_generation_service import *
-from app.services.healthtrack_service import predict_health_risk
-from app.services.anomaly_detection_service import detect_image
+from app.services.healthtrack_service import predict_health_risks, HEALTH_FEATURES, HEALTH_TRACKING_MAX_BATCH
+from app.services.anomaly_detection_service import detect_image, DETECTION_MODEL_VERSION
+from app.services.full_scan_service import run_full_scan, FULL_SCAN_ANALYSES
 from app.utils.error_handler import handle_error, handle_file_error, handle_no_file_selected_error, handle_bad_request
 from app.services.name_generation_service import generate_name
 from app.services.gynecologist_chat_service import *
+from app.utils.model_registry import model_stats
+from app.utils.helpers import iter_archive_images
+from app.utils.pagination import parse_limit
+from app.utils.result_cache import cached_result, result_cache
+from app.utils.image_response import negotiate_image_response, image_response, format_namespace
 import omim
 from app.models.user import User
 from omim import util
@@ -56,9 +66,58 @@ def predict():
         heart_rate = float(data.get('heart_rate'))
 
         features = np.array([[age, systolic_bp, diastolic_bp, bs, bt, heart_rate]])
-        risk_level = predict_health_risk(features)
+        result = predict_health_risks(features)[0]
 
-        return jsonify({"risk_level": risk_level}), 200
+        return jsonify(result), 200
+    except Exception as e:
+        return handle_error(e)
+
+def _health_record_features(record):
+    """Feature row for one batch record, given as an object or as a list in HEALTH_FEATURES order."""
+    if isinstance(record, dict):
+        missing = [field for field in HEALTH_FEATURES if field not in record]
+        if missing:
+            raise ValueError(f"Missing {', '.join(missing)}")
+        values = [record[field] for field in HEALTH_FEATURES]
+    elif isinstance(record, list):
+        if len(record) != len(HEALTH_FEATURES):
+            raise ValueError(f"Expected {len(HEALTH_FEATURES)} values ({', '.join(HEALTH_FEATURES)})")
+        values = record
+    else:
+        raise ValueError("Each record must be an object or a list of numbers")
+
+    row = []
+    for field, value in zip(HEALTH_FEATURES, values):
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            raise ValueError(f"{field} must be a number")
+        try:
+            number = float(value)
+        except ValueError:
+            raise ValueError(f"{field} must be a number")
+        if not math.isfinite(number):
+            raise ValueError(f"{field} must be a finite number")
+        row.append(number)
+    return row
+
+@bp.route('/health-tracking/batch', methods=['POST'])
+def predict_batch():
+    data = request.get_json(silent=True)
+    records = data.get('records') if isinstance(data, dict) else data
+    if not isinstance(records, list) or not records:
+        return handle_bad_request("Expected a non-empty list of records")
+    if len(records) > HEALTH_TRACKING_MAX_BATCH:
+        return handle_bad_request(f"At most {HEALTH_TRACKING_MAX_BATCH} records per request")
+
+    rows = []
+    for index, record in enumerate(records):
+        try:
+            rows.append(_health_record_features(record))
+        except ValueError as e:
+            return jsonify({"error": str(e), "index": index}), 400
+    features = np.array(rows, dtype=np.float64)
+
+    try:
+        return jsonify({"results": predict_health_risks(features)}), 200
     except Exception as e:
         return handle_error(e)
 
@@ -70,9 +129,43 @@ def process_text():
     if not transcription:
         return handle_bad_request('No transcription provided')
     
-    result = text_to_events(transcription)
-    
-    return jsonify(json.loads(result))
+    return jsonify(extract_events(transcription, data.get('language', 'english')))
+
+@bp.route('/process_text/bulk', methods=['POST'])
+def process_text_bulk():
+    """
+    Streams NDJSON in and out: one {"transcription", "id"?, "language"?}
+    object per request line, one result (or error) line per input line as
+    soon as it is parsed. Blank lines are skipped. `language` is "english"
+    (the default) or "french", which reads numeric dates day first.
+    """
+    def generate():
+        for line_number, line in enumerate(request.stream, start=1):
+            if not line.strip():
+                continue
+            result = {"line": line_number}
+            # A bad line becomes an error record; it must never end the stream
+            try:
+                item = json.loads(line)
+                if not isinstance(item, dict):
+                    raise ValueError('Each line must be a JSON object')
+                if 'id' in item:
+                    result["id"] = item['id']
+                transcription = item.get('transcription')
+                if not isinstance(transcription, str) or not transcription:
+                    raise ValueError('No transcription provided')
+                language = item.get('language', 'english')
+                if not isinstance(language, str):
+                    raise ValueError('language must be a string')
+                result.update(extract_events(transcription, language))
+            except ValueError as e:
+                result["error"] = str(e)
+            except Exception as e:
+                logger.error(f"Error processing bulk text line {line_number}: {str(e)}")
+                result["error"] = str(e)
+            yield json.dumps(result, ensure_ascii=False) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
 @bp.route('/upload', methods=['POST'])
 def upload_file():
@@ -94,11 +187,26 @@ def enhance_image_route():
     if file.filename == '':
         return handle_no_file_selected_error('image')
 
+    mode = request.args.get('mode', 'resize')
+    if mode not in ('resize', 'tiled'):
+        return handle_bad_request("mode must be 'resize' or 'tiled'")
+
+    try:
+        mimetype, image_format = negotiate_image_response()
+    except ValueError as e:
+        return handle_bad_request(str(e))
+
     try:
         image_bytes = file.read()
-        enhanced_image_bytes = enhance_image(image_bytes)
-        enhanced_image_base64 = base64.b64encode(enhanced_image_bytes).decode('utf-8')
-        return jsonify({'enhancedImage': enhanced_image_base64})
+        if mode == 'tiled':
+            enhanced_image_bytes = cached_result(format_namespace('enhance-image-tiled', image_format),
+                                                 ENHANCEMENT_MODEL_VERSION, image_bytes,
+                                                 lambda: enhance_image_tiled(image_bytes, image_format))
+        else:
+            enhanced_image_bytes = cached_result(format_namespace('enhance-image', image_format),
+                                                 ENHANCEMENT_MODEL_VERSION, image_bytes,
+                                                 lambda: enhance_image(image_bytes, image_format))
+        return image_response(mimetype, enhanced_image_bytes, image_format, 'enhancedImage')
 
     except Exception as e:
         return handle_error(e)
@@ -117,17 +225,20 @@ def calculate_circumference_route():
         if not image_bytes:
             return handle_bad_request('No image data provided')
 
-        model = load_model()
-        mask_image_bytes, circumference, pixel_value = generate_mask_and_circumference(
-            model, preprocess_image(image_bytes)
+        try:
+            mimetype, image_format = negotiate_image_response()
+        except ValueError as e:
+            return handle_bad_request(str(e))
+
+        mask_image_bytes, circumference, pixel_value = cached_result(
+            format_namespace('calculate-circumference', image_format), HEAD_CIRCUMFERENCE_MODEL_VERSION, image_bytes,
+            lambda: generate_mask_and_circumference(load_model(), preprocess_image(image_bytes), image_format)
         )
 
         if circumference is not None:
-            mask_base64 = base64.b64encode(mask_image_bytes).decode('utf-8')
-            return jsonify({
+            return image_response(mimetype, mask_image_bytes, image_format, 'maskImage', {
                 "circumference": circumference,
                 "pixelValue": pixel_value,
-                "maskImage": mask_base64
             })
         else:
             return handle_bad_request("Unable to calculate circumference")
@@ -135,6 +246,14 @@ def calculate_circumference_route():
     except Exception as e:
         return handle_error(e)
 
+@bp.route('/models/status', methods=['GET'])
+def models_status():
+    return jsonify(model_stats()), 200
+
+@bp.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(result_cache.stats()), 200
+
 @bp.route('/classify-ultrasound', methods=['POST'])
 def classify():
     if 'image' not in request.files:
@@ -144,8 +263,43 @@ def classify():
     image_bytes = image_file.read()
     
     try:
-        response = classify_image(image_bytes)
+        response = cached_result('classify-ultrasound', CLASSIFIER_MODEL_VERSION, image_bytes,
+                                 lambda: classify_image(image_bytes))
         return jsonify(response), 200
+    except ValueError as e:
+        return handle_bad_request(str(e))
+    except Exception as e:
+        return handle_error(e)
+
+def _limit_frames(frames, max_frames):
+    for count, frame in enumerate(frames, 1):
+        if count > max_frames:
+            raise ValueError(f'At most {max_frames} frames can be classified per request')
+        yield frame
+
+@bp.route('/classify-ultrasound/batch', methods=['POST'])
+def classify_batch():
+    """
+    Classifies many frames in one request. Frames are sent as repeated
+    `images` files, as a zip/tar `archive`, or both.
+    """
+    uploads = [f for f in request.files.getlist('images') if f.filename != '']
+    archive = request.files.get('archive')
+    if not uploads and (archive is None or archive.filename == ''):
+        return handle_file_error('images')
+
+    try:
+        frames = ((f.filename, f.read()) for f in uploads)
+        if archive is not None and archive.filename != '':
+            frames = chain(frames, iter_archive_images(archive, max_files=CLASSIFIER_MAX_FRAMES))
+
+        # Frames are read and classified one batch at a time
+        results = classify_images(_limit_frames(frames, CLASSIFIER_MAX_FRAMES))
+        if not results:
+            return handle_bad_request('No image frames provided')
+        return jsonify({"results": results, "count": len(results)}), 200
+    except ValueError as e:
+        return handle_bad_request(str(e))
     except Exception as e:
         return handle_error(e)
 
@@ -157,8 +311,9 @@ def api_generate_report():
     image_file = request.files['image']
     
     try:
-        image = Image.open(image_file)
-        html_content, pdf_filename = create_report(image)
+        html_content, pdf_filename = create_report_from_bytes(image_file.read())
+        if _wants_pdf():
+            return _send_report_pdf(pdf_filename)
         pdf_url = url_for('static', filename=f'reports/{pdf_filename}', _external=True)
         return jsonify({
             "report": html_content,
@@ -167,6 +322,55 @@ def api_generate_report():
     except Exception as e:
         return handle_error(e)
 
+def _wants_pdf():
+    return request.accept_mimetypes.best_match(['application/json', 'application/pdf']) == 'application/pdf'
+
+def _send_report_pdf(pdf_filename):
+    return send_file(report_pdf_file(pdf_filename), mimetype='application/pdf', download_name=pdf_filename)
+
+@bp.route('/generate-report/jobs', methods=['POST'])
+def submit_report_job_route():
+    if 'image' not in request.files:
+        return handle_file_error('image')
+
+    image_file = request.files['image']
+    if image_file.filename == '':
+        return handle_no_file_selected_error('image')
+
+    try:
+        image_bytes = image_file.read()
+        if not image_bytes:
+            return handle_bad_request('No image data provided')
+        job = submit_report_job(image_bytes)
+        return jsonify({
+            "job_id": job.id,
+            "status": job.status,
+            "statusUrl": url_for('api.get_report_job_route', job_id=job.id, _external=True)
+        }), 202
+    except Exception as e:
+        return handle_error(e)
+
+@bp.route('/generate-report/jobs/<job_id>', methods=['GET'])
+def get_report_job_route(job_id):
+    try:
+        job = get_report_job(job_id)
+        if job is None:
+            return jsonify({"error": "Report job not found"}), 404
+
+        response = {"job_id": job.id, "status": job.status, "attempts": job.attempts}
+        if job.status == 'succeeded':
+            # Stored PDFs are content-addressed, so one evicted since the job ran is rendered again
+            pdf_filename = generate_pdf(job.report_html)
+            if _wants_pdf():
+                return _send_report_pdf(pdf_filename)
+            response["report"] = job.report_html
+            response["pdfLink"] = url_for('static', filename=f'reports/{pdf_filename}', _external=True)
+        elif job.status == 'failed':
+            response["error"] = job.error
+        return jsonify(response), 200
+    except Exception as e:
+        return handle_error(e)
+
 logger = logging.getLogger(__name__)
 
 @bp.route('/chatbot', methods=['POST'])
@@ -187,6 +391,47 @@ def chatbot():
         logger.error(f"Error in chatbot route: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@bp.route('/chatbot/stream', methods=['POST'])
+def chatbot_stream():
+    """
+    Streams the reply as server-sent events: a `data: {"content": ...}` event
+    per chunk, then a `done` event with the full reply, or an `error` event
+    if the stream breaks off.
+    """
+    data = request.json
+    message = data.get('message')
+    user_id = data.get('user_id')
+
+    if not user_id:
+        return jsonify({"error": "User ID is required"}), 400
+    if not message:
+        return jsonify({"error": "Message is required"}), 400
+
+    try:
+        chunks = stream_chatbot_response(message, user_id)
+    except Exception as e:
+        logger.error(f"Error in chatbot stream route: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+    def generate():
+        parts = []
+        try:
+            for chunk in chunks:
+                parts.append(chunk)
+                yield f"data: {json.dumps({'content': chunk})}\n\n"
+            yield f"event: done\ndata: {json.dumps({'content': ''.join(parts).strip()})}\n\n"
+        except Exception as e:
+            logger.error(f"Error while streaming chatbot response: {str(e)}")
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+        finally:
+            # Stops the upstream stream as soon as the client goes away
+            chunks.close()
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @bp.route('/chatbot/history', methods=['GET'])
 def get_history():
     user_id = request.args.get('user_id')
@@ -196,9 +441,11 @@ def get_history():
         return jsonify({"error": "User ID is required"}), 400
     
     try:
-        history = get_conversation_history(user_id)
-        logger.debug(f"Returning history for user {user_id}: {history}")
-        return jsonify({"history": history}), 200
+        limit = parse_limit(request.args.get('limit'))
+        history, next_cursor = get_conversation_history(user_id, limit, request.args.get('cursor'))
+        return jsonify({"history": history, "next_cursor": next_cursor}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Error in get_history route: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -247,11 +494,120 @@ def get_chat_history_route():
         return jsonify({"error": "Patient ID and Gynecologist ID are required"}), 400
     
     try:
-        history = get_chat_history(patient_id, gynecologist_id)
+        history = get_chat_history(patient_id, gynecologist_id, request.args.get('since_id', type=int))
         return jsonify(history), 200
     except Exception as e:
         logger.error(f"Error in get_chat_history_route: {str(e)}")
         return jsonify({"error": str(e)}), 500
+
+@bp.route('/gynecologist/chat/read', methods=['POST'])
+def mark_chat_read():
+    data = request.json or {}
+    patient_id = data.get('patient_id')
+    gynecologist_id = data.get('gynecologist_id')
+    reader = data.get('reader')
+    up_to_id = data.get('up_to_id')
+
+    if not all([patient_id, gynecologist_id, reader, up_to_id]):
+        return jsonify({"error": "Missing required fields"}), 400
+
+    try:
+        marked = mark_messages_read(patient_id, gynecologist_id, reader, int(up_to_id))
+        return jsonify({"marked": marked}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in mark_chat_read route: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/gynecologist/unread-counts', methods=['GET'])
+def get_gynecologist_unread_counts_route():
+    gynecologist_id = request.args.get('gynecologist_id', type=int)
+    if not gynecologist_id:
+        return jsonify({"error": "Gynecologist ID is required"}), 400
+
+    try:
+        return jsonify(get_gynecologist_unread_counts(gynecologist_id)), 200
+    except Exception as e:
+        logger.error(f"Error in get_gynecologist_unread_counts_route: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/patient/unread-count', methods=['GET'])
+def get_patient_unread_count_route():
+    patient_id = request.args.get('patient_id', type=int)
+    if not patient_id:
+        return jsonify({"error": "Patient ID is required"}), 400
+
+    try:
+        return jsonify(get_patient_unread_count(patient_id)), 200
+    except Exception as e:
+        logger.error(f"Error in get_patient_unread_count_route: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+# Long polls and event streams hold a request thread while idle, so they need
+# the threaded workers configured in gunicorn.conf.py. They also end well inside
+# the 30 s worker timeout; clients poll again, and EventSource reconnects with
+# Last-Event-ID.
+LONG_POLL_MAX_TIMEOUT = 20
+STREAM_MAX_SECONDS = 25
+STREAM_KEEPALIVE_SECONDS = 10
+
+@bp.route('/gynecologist/chat/poll', methods=['GET'])
+def poll_chat_messages():
+    """Long-poll: returns new messages after `since_id` as soon as there are any, or [] at the timeout."""
+    patient_id = request.args.get('patient_id', type=int)
+    gynecologist_id = request.args.get('gynecologist_id', type=int)
+    since_id = request.args.get('since_id', 0, type=int)
+    timeout = min(max(request.args.get('timeout', LONG_POLL_MAX_TIMEOUT, type=float), 0), LONG_POLL_MAX_TIMEOUT)
+
+    if not patient_id or not gynecologist_id:
+        return jsonify({"error": "Patient ID and Gynecologist ID are required"}), 400
+
+    try:
+        messages = wait_for_messages(patient_id, gynecologist_id, since_id, timeout)
+        return jsonify({"messages": messages}), 200
+    except Exception as e:
+        logger.error(f"Error in poll_chat_messages route: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/gynecologist/chat/stream', methods=['GET'])
+def stream_chat_messages():
+    """
+    Server-sent events: one `message` event per new message, with the message
+    id as the event id so a reconnecting EventSource resumes via Last-Event-ID.
+    The stream ends after STREAM_MAX_SECONDS and the client reconnects.
+    """
+    patient_id = request.args.get('patient_id', type=int)
+    gynecologist_id = request.args.get('gynecologist_id', type=int)
+    since_id = request.args.get('since_id', type=int)
+    if since_id is None:
+        since_id = request.headers.get('Last-Event-ID', 0, type=int)
+
+    if not patient_id or not gynecologist_id:
+        return jsonify({"error": "Patient ID and Gynecologist ID are required"}), 400
+
+    def generate():
+        last_id = since_id
+        deadline = time.monotonic() + STREAM_MAX_SECONDS
+        # Ask the client to reconnect promptly when the stream ends
+        yield "retry: 1000\n\n"
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            messages = wait_for_messages(patient_id, gynecologist_id, last_id, min(remaining, STREAM_KEEPALIVE_SECONDS))
+            if not messages:
+                yield ": keep-alive\n\n"
+                continue
+            for message in messages:
+                yield f"id: {message['id']}\nevent: message\ndata: {json.dumps(message)}\n\n"
+            # History is ordered by timestamp, which need not follow id order
+            last_id = max(message['id'] for message in messages)
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
     
 @bp.route('/gynecologist/conversations', methods=['GET'])
 def get_gynecologist_chats():
@@ -302,7 +658,7 @@ def get_patient_chat_history():
         if not pregnancy_info or not pregnancy_info.gynecologist_id:
             return jsonify({"error": "No assigned gynecologist found for this patient."}), 404
         
-        history = get_chat_history(patient_id, pregnancy_info.gynecologist_id)
+        history = get_chat_history(patient_id, pregnancy_info.gynecologist_id, request.args.get('since_id', type=int))
         return jsonify(history), 200
     except Exception as e:
         logger.error(f"Error in get_patient_chat_history route: {str(e)}")
@@ -354,18 +710,67 @@ def detect_image_route():
     if file.filename == '':
         return handle_no_file_selected_error('image')
 
+    if request.args.get('render', 'true').lower() in ('false', '0', 'no'):
+        try:
+            image_bytes = file.read()
+
+            def run_decode():
+                detections = detect_image(image_bytes, render=False)[1]
+                if detections is None:
+                    raise ValueError('Image detection failed')
+                return detections
+
+            detections = cached_result('detect-image-boxes', DETECTION_MODEL_VERSION, image_bytes, run_decode)
+            return jsonify({'detections': detections})
+
+        except Exception as e:
+            return handle_error(e)
+
+    try:
+        mimetype, image_format = negotiate_image_response()
+    except ValueError as e:
+        return handle_bad_request(str(e))
+
     try:
         image_bytes = file.read()
-        detected_image_bytes = detect_image(image_bytes)
-        if detected_image_bytes is None:
-            raise ValueError('Image detection failed')
 
-        detected_image_base64 = base64.b64encode(detected_image_bytes.getvalue()).decode('utf-8')
-        return jsonify({'detectedImage': detected_image_base64})
+        def run_detection():
+            detected_image_bytes, detections = detect_image(image_bytes, image_format)
+            if detected_image_bytes is None:
+                raise ValueError('Image detection failed')
+            return detected_image_bytes, detections
+
+        detected_image_bytes, detections = cached_result(format_namespace('detect-image', image_format),
+                                                         DETECTION_MODEL_VERSION, image_bytes, run_detection)
+        return image_response(mimetype, detected_image_bytes, image_format, 'detectedImage',
+                              {'detections': detections})
 
     except Exception as e:
         return handle_error(e)
 
+@bp.route('/full-scan', methods=['POST'])
+def full_scan_route():
+    if 'image' not in request.files:
+        return handle_file_error('image')
+
+    file = request.files['image']
+    if file.filename == '':
+        return handle_no_file_selected_error('image')
+
+    requested = request.args.get('analyses')
+    analyses = [name.strip() for name in requested.split(',') if name.strip()] if requested else list(FULL_SCAN_ANALYSES)
+    unknown = [name for name in analyses if name not in FULL_SCAN_ANALYSES]
+    if unknown:
+        return handle_bad_request(f"Unknown analyses: {', '.join(unknown)}")
+
+    try:
+        image_bytes = file.read()
+        if not image_bytes:
+            return handle_bad_request('No image data provided')
+        return jsonify(run_full_scan(image_bytes, analyses)), 200
+    except Exception as e:
+        return handle_error(e)
+
 @bp.route('/calculate-fetal-age', methods=['POST'])
 def get_fetal_age():
     data = request.json
@@ -374,7 +779,10 @@ def get_fetal_age():
         return jsonify({'error': 'Circumference not provided'}), 400
 
     try:
-        fetal_age = calculate_fetal_age(circumference_cm)
+        if isinstance(circumference_cm, list):
+            fetal_age = calculate_fetal_ages(circumference_cm).tolist()
+        else:
+            fetal_age = calculate_fetal_age(circumference_cm)
         return jsonify({'fetal_age': fetal_age})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
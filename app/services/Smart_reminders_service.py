@@ -1,5 +1,4 @@
 import re
-import json
 import time
 from datetime import datetime, timedelta
 from dateutil import parser
@@ -13,29 +12,149 @@ def standardize_date(date_string, language="english"):
     except (ValueError, TypeError):
         return ""
 
-def extract_dates(text):
-    date_pattern = r'\b(\d{1,2}[/-]\d{1,2}[/-]\d{2,4}|\d{1,2}\s*[A-Za-z]+\s*\d{2,4})\b'
-    dates = re.findall(date_pattern, text, re.IGNORECASE)
-    return [standardize_date(date) for date in dates if standardize_date(date)]
+EVENT_PATTERNS = [
+    "take my medicine",
+    "check my blood pressure",
+    "meeting",
+    "doctor's appointment",
+    "medication",
+    "schedule",
+    "appointment",
+    "visit",
+    "yoga class",
+]
+
+RECURRENCE_PATTERNS = {
+    'everyday': 'daily',
+    'every week': 'weekly',
+    'every month': 'monthly',
+    'daily': 'daily',
+    'weekly': 'weekly',
+    'monthly': 'monthly',
+}
+
+# "5 pm 12" is a time followed by a number, not a date
+DATE_PATTERN = r'\d{1,2}[/-]\d{1,2}[/-]\d{2,4}|\d{1,2}\s*(?![ap]\.?m\b)[A-Za-z]+\s*\d{2,4}'
+TIME_PATTERN = r'\d{1,2}:\d{2}\s*(?:[ap]\.?m)?|\d{1,2}\s*(?:[ap]\.?m)?'
+
+
+def _alternation(words):
+    # Longest first so "doctor's appointment" wins over "appointment"
+    return '|'.join(re.escape(word) for word in sorted(words, key=len, reverse=True))
+
+
+# Token kinds in priority order: where several match at the same position the
+# first one wins, so the digits of a date are never also read as a time.
+_TOKEN_PATTERNS = [
+    ('event', _alternation(EVENT_PATTERNS)),
+    ('every_hours', r'every (?P<hours>\d+)\s*hour'),
+    ('every_minutes', r'every (?P<minutes>\d+)\s*minute'),
+    ('recurrence', _alternation(RECURRENCE_PATTERNS)),
+    ('date', rf'\b(?:{DATE_PATTERN})\b'),
+    ('time', rf'\b(?:{TIME_PATTERN})\b'),
+]
+
+
+def _compile_tokenizer(kinds):
+    return re.compile(
+        '|'.join(f'(?P<{kind}>{pattern})' for kind, pattern in _TOKEN_PATTERNS if kind in kinds),
+        re.IGNORECASE,
+    )
+
+
+_TOKENIZER = _compile_tokenizer({kind for kind, _ in _TOKEN_PATTERNS})
+# Used where a date-shaped match turns out not to be a date (e.g. "5 pm 12")
+_NON_DATE_TOKENIZER = _compile_tokenizer({kind for kind, _ in _TOKEN_PATTERNS if kind != 'date'})
+
+_TIME_12H = re.compile(r'^(\d{1,2}):(\d{2})\s*(AM|PM)$')
+_TIME_24H = re.compile(r'^(\d{1,2}):(\d{2})$')
+
+
+def tokenize(text, language="english"):
+    """
+    Scans the text once and returns its (kind, match, date) tokens in order.
+
+    `date` is the standardized date for date tokens and None otherwise;
+    French text reads numeric dates day first. Each distinct date string is
+    parsed once per call.
+    """
+    standardized = {}
+    tokens = []
+    pos = 0
+    while True:
+        match = _TOKENIZER.search(text, pos)
+        if match is None:
+            break
+        date = None
+        if match.lastgroup == 'date':
+            date_string = match.group('date')
+            if date_string not in standardized:
+                standardized[date_string] = standardize_date(date_string, language)
+            date = standardized[date_string]
+            if not date:
+                start = match.start()
+                match = _NON_DATE_TOKENIZER.match(text, start)
+                if match is None:
+                    pos = start + 1
+                    continue
+        tokens.append((match.lastgroup, match, date))
+        pos = match.end()
+    return tokens
+
+
+def _recurrence(tokens):
+    """Every-N-hours beats every-N-minutes beats the keywords, in RECURRENCE_PATTERNS order."""
+    hours = minutes = None
+    keywords = set()
+    for kind, match, _ in tokens:
+        if kind == 'every_hours' and hours is None:
+            hours = int(match.group('hours'))
+        elif kind == 'every_minutes' and minutes is None:
+            minutes = int(match.group('minutes'))
+        elif kind == 'recurrence':
+            keywords.add(match.group().lower())
+
+    if hours is not None:
+        return f'every {hours} hours'
+    if minutes is not None:
+        return f'every {minutes} minutes'
+    for key, value in RECURRENCE_PATTERNS.items():
+        if key in keywords:
+            return value
+    return None
+
+
+def _events(tokens):
+    """Pairs every event with the first time and the first date that follow it."""
+    events = []
+    next_time = next_date = None
+    for kind, match, date in reversed(tokens):
+        if kind == 'time':
+            next_time = match.group()
+        elif kind == 'date':
+            next_date = date
+        elif kind == 'event':
+            events.append({
+                "description": match.group().capitalize(),
+                "date": next_date,
+                "time": format_time(next_time),
+            })
+    events.reverse()
+    return events
 
-def extract_times(text):
-    time_pattern = r'\b(\d{1,2}:\d{2}\s*(?:AM|PM|am|pm|a.m|.p.m)?|\d{1,2}\s*(?:AM|PM|am|pm|.a.m|.p.m)?)\b'
-    return re.findall(time_pattern, text, re.IGNORECASE)
 
 def format_time(time_str):
     if not time_str:
         return ''
     
-    time_str = time_str.strip().upper()
-    time_pattern_12 = r'^(\d{1,2}):(\d{2})\s*(AM|PM)$'
-    time_pattern_24 = r'^(\d{1,2}):(\d{2})$'
+    time_str = time_str.strip().upper().replace('.', '')
     
-    match_12 = re.match(time_pattern_12, time_str)
+    match_12 = _TIME_12H.match(time_str)
     if match_12:
         hour, minute, period = match_12.groups()
         return f'{int(hour)}:{minute} {period}'
 
-    match_24 = re.match(time_pattern_24, time_str)
+    match_24 = _TIME_24H.match(time_str)
     if match_24:
         hour, minute = match_24.groups()
         dt = datetime.strptime(f"{hour}:{minute}", "%H:%M")
@@ -43,73 +162,6 @@ def format_time(time_str):
     
     return time_str
 
-def parse_time_and_recurrence(text):
-    recurrence_patterns = {
-        'everyday': 'daily',
-        'every week': 'weekly',
-        'every month': 'monthly',
-        'daily': 'daily',
-        'weekly': 'weekly',
-        'monthly': 'monthly',
-    }
-    
-    hour_pattern = re.search(r'every (\d+)\s*hour', text, re.IGNORECASE)
-    minute_pattern = re.search(r'every (\d+)\s*minute', text, re.IGNORECASE)
-    
-    recurrence = None
-    for key, value in recurrence_patterns.items():
-        if key in text.lower():
-            recurrence = value
-            break
-
-    if hour_pattern:
-        hours = int(hour_pattern.group(1))
-        recurrence = f'every {hours} hours'
-    elif minute_pattern:
-        minutes = int(minute_pattern.group(1))
-        recurrence = f'every {minutes} minutes'
-    
-    times = extract_times(text)
-    normalized_times = [format_time(time) for time in times]
-    
-    return normalized_times, recurrence
-
-def extract_events_and_associate_times(text):
-    event_patterns = [
-        r'take my medicine',
-        r'check my blood pressure',
-        r'meeting',
-        r'doctor\'s appointment',
-        r'medication',
-        r'schedule',
-        r'appointment',
-        r'visit',
-        r'yoga class'
-    ]
-    
-    events = []
-    times = extract_times(text)
-    
-    for pattern in event_patterns:
-        matches = re.finditer(pattern, text, re.IGNORECASE)
-        for match in matches:
-            event_start = match.start()
-            event_desc = match.group()
-            
-            time_match = re.search(r'\b(\d{1,2}:\d{2}\s*(?:AM|PM|am|pm|.a.m|.p.m)?|\d{1,2}\s*(?:AM|PM|am|pm|.a.m|.p.m)?)\b', text[event_start:], re.IGNORECASE)
-            time_str = time_match.group(0).strip().upper() if time_match else None
-            
-            date_match = re.search(r'\b(\d{1,2}[/-]\d{1,2}[/-]\d{2,4}|\d{1,2}\s*[A-Za-z]+\s*\d{2,4})\b', text[event_start:], re.IGNORECASE)
-            date_str = standardize_date(date_match.group(0)) if date_match else None
-            
-            events.append({
-                "description": event_desc.capitalize(),
-                "date": date_str,
-                "time": format_time(time_str)
-            })
-    
-    return events
-
 def get_default_date(date_str):
     today = datetime.now()
     if date_str.lower() in ["today", "tomorrow"]:
@@ -127,13 +179,20 @@ def get_day_of_week(date_str):
     except ValueError:
         return ""
 
-def text_to_events(text, language="english"):
+def extract_events(text, language="english"):
+    """
+    Extracts the events, dates, times and recurrence from a transcription.
+
+    Returns:
+        dict: "events", "dates" and "times" (None when empty) and "processing_time".
+    """
     start_time = time.time()
     
-    dates = extract_dates(text)
-    events = extract_events_and_associate_times(text)
-    
-    times, recurrence = parse_time_and_recurrence(text)
+    tokens = tokenize(text, language)
+    dates = [date for kind, _, date in tokens if kind == 'date']
+    times = [format_time(match.group()) for kind, match, _ in tokens if kind == 'time']
+    recurrence = _recurrence(tokens)
+    events = _events(tokens)
     
     for event in events:
         if event['time'] in times:
@@ -159,4 +218,4 @@ def text_to_events(text, language="english"):
     total_time = time.time() - start_time
     result["processing_time"] = f"{total_time:.2f} seconds"
     
-    return json.dumps(result, ensure_ascii=False, indent=2)
+    return result
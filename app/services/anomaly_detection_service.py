@@ -1,68 +1,96 @@
-import argparse
+import threading
 import cv2
 import numpy as np
-import onnxruntime as ort
 import traceback
-from PIL import Image, ImageDraw
-from io import BytesIO
+from app.utils.model_registry import get_model, create_onnx_session
+from app.utils.result_cache import file_version
+from app.utils.helpers import DecodedImage, encode_image
+
+DETECTION_MODEL_PATH = 'app/models/Anomaly.onnx'
+DETECTION_MODEL_VERSION = file_version(DETECTION_MODEL_PATH)
+
+# Grey used by YOLOv8 to pad letterboxed inputs
+LETTERBOX_PAD_VALUE = 114
+
+# One reusable NCHW input buffer per thread; session.run() reads it synchronously
+_input_buffers = threading.local()
+
+def _input_buffer(height, width):
+    buffer = getattr(_input_buffers, 'array', None)
+    if buffer is None or buffer.shape != (1, 3, height, width):
+        buffer = np.empty((1, 3, height, width), dtype=np.float32)
+        _input_buffers.array = buffer
+    return buffer
 
-# Existing functions retained from your work
 def load_detection_model():
+    """
+    Returns the shared detection session with its input and output names,
+    which are resolved once when the session is created.
+    """
+    return get_model('anomaly_detection', _create_detection_session)
+
+def _create_detection_session():
     try:
-        model_path = 'app/models/Anomaly.onnx'
-        session = ort.InferenceSession(model_path)
+        session = create_onnx_session(DETECTION_MODEL_PATH)
+        input_name = session.get_inputs()[0].name
+        output_names = [output.name for output in session.get_outputs()]
         print("Model loaded successfully.")
-        return session
+        return session, input_name, output_names
     except Exception as e:
         print(f"Error loading model: {str(e)}")
         traceback.print_exc()
         raise
 
-def detect_image(image_bytes):
+def detect_image(image_bytes, image_format='PNG', render=True):
     try:
-        # Instantiate the Yolov8 class
-        yolov8_detector = Yolov8(
-            onnx_model='app/models/Anomaly.onnx', 
-            input_image=None,  # We won't use file paths here, just image bytes
-            confidence_thres=0.2, 
-            iou_thres=0.4
-        )
-        
-        print("Loading model...")
-        model = load_detection_model()
-        if model is None:
-            raise ValueError("Model is not loaded properly.")
-        
-        print("Starting image detection...")
-        
-        # Use the preprocess_image method from the Yolov8 class
-        yolov8_detector.input_image = Image.open(BytesIO(image_bytes)).convert('RGB')
-        input_array = yolov8_detector.preprocess()
-
-        if input_array is None:
-            raise ValueError("Image preprocessing failed.")
-        
-        print(f"Input array shape: {input_array.shape}")
-
-        input_name = model.get_inputs()[0].name
-        output_names = [output.name for output in model.get_outputs()]
-        results = model.run(output_names, {input_name: input_array})
-
-        output_array = results[0]
-        print(f"Output array shape: {output_array.shape}")
-
-        detected_image = yolov8_detector.postprocess(yolov8_detector.img, output_array)
-        
-        detected_image_bytes = BytesIO()
-        Image.fromarray(cv2.cvtColor(detected_image, cv2.COLOR_BGR2RGB)).save(detected_image_bytes, format='PNG')
-        detected_image_bytes.seek(0)
-
-        return detected_image_bytes
-
+        return detect_pil_image(DecodedImage(image_bytes).rgb, image_format, render)
     except Exception as e:
         print(f"Error in detect_image: {str(e)}")
         traceback.print_exc()
-        return None
+        return None, None
+
+def detect_pil_image(image, image_format='PNG', render=True):
+    """
+    Runs anomaly detection on a decoded RGB PIL image.
+
+    With `render=False` the boxes are not drawn and no image is encoded,
+    for callers that only need the detections.
+
+    Returns:
+        tuple: (annotated image encoded as `image_format` or None, list of detections)
+    """
+    # Instantiate the Yolov8 class
+    yolov8_detector = Yolov8(
+        onnx_model=DETECTION_MODEL_PATH, 
+        input_image=image,
+        confidence_thres=0.2, 
+        iou_thres=0.4
+    )
+    
+    session, input_name, output_names = load_detection_model()
+    
+    print("Starting image detection...")
+    
+    input_array = yolov8_detector.preprocess()
+
+    if input_array is None:
+        raise ValueError("Image preprocessing failed.")
+    
+    print(f"Input array shape: {input_array.shape}")
+
+    results = session.run(output_names, {input_name: input_array})
+
+    output_array = results[0]
+    print(f"Output array shape: {output_array.shape}")
+
+    if not render:
+        return None, yolov8_detector.decode(output_array)
+
+    detected_image, detections = yolov8_detector.postprocess(yolov8_detector.img, output_array)
+    
+    detected_image_bytes = encode_image(cv2.cvtColor(detected_image, cv2.COLOR_BGR2RGB), image_format)
+
+    return detected_image_bytes, detections
 
 # Yolov8 class based on the provided code
 class Yolov8:
@@ -94,45 +122,84 @@ class Yolov8:
         cv2.putText(img, label, (label_x, label_y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1, cv2.LINE_AA)
 
     def preprocess(self):
-        self.img = np.array(self.input_image)
+        """
+        Letterboxes the image into the model input: it is resized keeping its
+        aspect ratio, centred and padded with grey, then written as normalized
+        BGR float32 straight into this thread's reusable NCHW buffer.
+        """
+        self.img = np.asarray(self.input_image).copy()
         self.img_height, self.img_width = self.img.shape[:2]
-        img = cv2.cvtColor(self.img, cv2.COLOR_RGB2BGR)
-        img = cv2.resize(img, (self.input_width, self.input_height))
-        image_data = np.array(img) / 255.0
-        image_data = np.transpose(image_data, (2, 0, 1))  # Channel first
-        image_data = np.expand_dims(image_data, axis=0).astype(np.float32)
+
+        self.ratio = min(self.input_width / self.img_width, self.input_height / self.img_height)
+        resized_width = max(1, round(self.img_width * self.ratio))
+        resized_height = max(1, round(self.img_height * self.ratio))
+        self.pad_x = (self.input_width - resized_width) // 2
+        self.pad_y = (self.input_height - resized_height) // 2
+        resized = cv2.resize(self.img, (resized_width, resized_height), interpolation=cv2.INTER_LINEAR)
+
+        image_data = _input_buffer(self.input_height, self.input_width)
+        image_data.fill(LETTERBOX_PAD_VALUE / 255.0)
+        rows = slice(self.pad_y, self.pad_y + resized_height)
+        cols = slice(self.pad_x, self.pad_x + resized_width)
+        scale = np.float32(1 / 255.0)
+        for channel in range(3):
+            # The model takes BGR, the decoded image is RGB
+            np.multiply(resized[:, :, 2 - channel], scale, out=image_data[0, channel, rows, cols], dtype=np.float32)
         return image_data
 
+    def decode(self, output):
+        """
+        Decodes the raw model output into detections in original image coordinates.
+
+        Confidence filtering, box conversion and class selection run over all
+        anchors at once, followed by a class-aware NMS.
+
+        Returns:
+            list[dict]: One entry per kept box with its class, score and
+            [left, top, width, height] box.
+        """
+        outputs = np.squeeze(output[0]).T  # (anchors, 4 + num_classes)
+        class_scores = outputs[:, 4:]
+        class_ids = np.argmax(class_scores, axis=1)
+        scores = class_scores[np.arange(len(class_scores)), class_ids]
+
+        keep = scores >= self.confidence_thres
+        if not np.any(keep):
+            return []
+        xywh = outputs[keep, :4]
+        scores = scores[keep]
+        class_ids = class_ids[keep]
+
+        # Undo the letterbox and clip the boxes to the image
+        left = np.clip((xywh[:, 0] - xywh[:, 2] / 2 - self.pad_x) / self.ratio, 0, self.img_width)
+        top = np.clip((xywh[:, 1] - xywh[:, 3] / 2 - self.pad_y) / self.ratio, 0, self.img_height)
+        right = np.clip((xywh[:, 0] + xywh[:, 2] / 2 - self.pad_x) / self.ratio, 0, self.img_width)
+        bottom = np.clip((xywh[:, 1] + xywh[:, 3] / 2 - self.pad_y) / self.ratio, 0, self.img_height)
+        boxes = np.stack([left, top, right - left, bottom - top], axis=1).astype(np.int32)
+
+        # Boxes that fall entirely in the padding are empty once clipped
+        valid = (boxes[:, 2] > 0) & (boxes[:, 3] > 0)
+        if not np.any(valid):
+            return []
+        boxes, scores, class_ids = boxes[valid], scores[valid], class_ids[valid]
+
+        indices = cv2.dnn.NMSBoxesBatched(
+            boxes.tolist(), scores.tolist(), class_ids.tolist(), self.confidence_thres, self.iou_thres
+        )
+        detections = []
+        for i in np.asarray(indices, dtype=np.int64).flatten():
+            class_id = int(class_ids[i])
+            detections.append({
+                "class": self.classes[class_id],
+                "class_id": class_id,
+                "score": float(scores[i]),
+                "box": boxes[i].tolist(),
+            })
+        return detections
+
     def postprocess(self, input_image, output):
-        outputs = np.transpose(np.squeeze(output[0]))
-        rows = outputs.shape[0]
-        boxes = []
-        scores = []
-        class_ids = []
-        x_factor = self.img_width / self.input_width
-        y_factor = self.img_height / self.input_height
-
-        for i in range(rows):
-            classes_scores = outputs[i][4:]
-            max_score = np.amax(classes_scores)
-            if max_score >= self.confidence_thres:
-                class_id = np.argmax(classes_scores)
-                x, y, w, h = outputs[i][0], outputs[i][1], outputs[i][2], outputs[i][3]
-                left = int((x - w / 2) * x_factor)
-                top = int((y - h / 2) * y_factor)
-                width = int(w * x_factor)
-                height = int(h * y_factor)
-                class_ids.append(class_id)
-                scores.append(max_score)
-                boxes.append([left, top, width, height])
-
-        indices = cv2.dnn.NMSBoxes(boxes, scores, self.confidence_thres, self.iou_thres)
-        # Check if indices are valid and not empty
-        if len(indices) > 0:
-            for i in indices.flatten():
-                box = boxes[i]
-                score = scores[i]
-                class_id = class_ids[i]
-                self.draw_detections(input_image, box, score, class_id)
-
-        return input_image
+        detections = self.decode(output)
+        for detection in detections:
+            self.draw_detections(input_image, detection["box"], detection["score"], detection["class_id"])
+
+        return input_image, detections
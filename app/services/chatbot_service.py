@@ -1,11 +1,14 @@
 import os
 import logging
+from functools import lru_cache
 from groq import Groq
 from langchain_community.chat_message_histories import ChatMessageHistory
 from langchain_core.messages import AIMessage, HumanMessage
 from app import db
 from app.models.chat_message import ChatMessage
+from app.models.chat_summary import ChatSummary
 from app.schemas.chat_message_schema import chat_messages_schema
+from app.utils.pagination import DEFAULT_PAGE_SIZE, encode_cursor, decode_cursor
 from datetime import timezone
 
 logging.basicConfig(level=logging.DEBUG)
@@ -13,6 +16,123 @@ logger = logging.getLogger(__name__)
 
 client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
 
+CHATBOT_MODEL = "llama3-8b-8192"
+SYSTEM_PROMPT = "You are Dr. Gyno, a friendly and empathetic prenatal care expert."
+SUMMARY_PROMPT = (
+    "Summarize this conversation between a patient and Dr. Gyno, a prenatal care expert, "
+    "for Dr. Gyno's own reference. Keep every medical fact, symptom, date, medication and "
+    "concern the patient mentioned. Reply with the summary only."
+)
+
+# Token budget for the recent messages sent verbatim. Once the window grows past
+# it, the oldest messages are folded into the summary until it is back to half,
+# so a summary is written every few turns rather than on every one.
+CHATBOT_CONTEXT_TOKENS = int(os.environ.get('CHATBOT_CONTEXT_TOKENS', 3000))
+CHATBOT_SUMMARY_MAX_TOKENS = int(os.environ.get('CHATBOT_SUMMARY_MAX_TOKENS', 400))
+# Most message tokens handed to one summarization call; anything older is dropped
+CHATBOT_SUMMARY_INPUT_TOKENS = int(os.environ.get('CHATBOT_SUMMARY_INPUT_TOKENS', 6000))
+
+
+@lru_cache(maxsize=1)
+def _token_encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"tiktoken unavailable, estimating tokens from length: {str(e)}")
+        return None
+
+
+def count_tokens(text):
+    encoding = _token_encoding()
+    if encoding is None:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _as_prompt_message(msg):
+    return {"role": "assistant" if msg.is_bot else "user", "content": msg.content}
+
+
+def _summarize(previous_summary, messages):
+    transcript = "\n".join(
+        f"{'Dr. Gyno' if msg.is_bot else 'Patient'}: {msg.content}" for msg in messages
+    )
+    if previous_summary:
+        transcript = f"Summary so far: {previous_summary}\n\n{transcript}"
+    response = client.chat.completions.create(
+        messages=[
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": transcript},
+        ],
+        model=CHATBOT_MODEL,
+        max_tokens=CHATBOT_SUMMARY_MAX_TOKENS,
+        temperature=0.2,
+    )
+    return response.choices[0].message.content.strip()
+
+
+def _fold_into_summary(user_id, summary, messages):
+    """Replaces `summary` with one that also covers `messages`, and persists it."""
+    folded, budget = [], CHATBOT_SUMMARY_INPUT_TOKENS
+    for msg, tokens in reversed(messages):
+        if tokens > budget:
+            break
+        folded.append(msg)
+        budget -= tokens
+    folded.reverse()
+
+    previous = summary.content if summary else None
+    content = _summarize(previous, folded) if folded else (previous or "")
+    if summary is None:
+        summary = ChatSummary(user_id=user_id)
+        db.session.add(summary)
+    summary.content = content
+    summary.last_message_id = messages[-1][0].id
+    summary.token_count = count_tokens(content)
+    db.session.commit()
+    logger.debug(f"Folded {len(messages)} messages into the summary for user {user_id}")
+    return summary
+
+
+def build_context(user_id, message):
+    """
+    Builds the Groq messages for a new user message: the system prompt, the
+    summary of older turns, then the recent messages within the window budget.
+    """
+    summary = ChatSummary.query.filter_by(user_id=user_id).first()
+    query = ChatMessage.query.filter_by(user_id=user_id)
+    if summary is not None:
+        query = query.filter(ChatMessage.id > summary.last_message_id)
+    window = [(msg, count_tokens(msg.content)) for msg in query.order_by(ChatMessage.id).all()]
+
+    total = sum(tokens for _, tokens in window)
+    if total > CHATBOT_CONTEXT_TOKENS:
+        split = 0
+        while split < len(window) and total > CHATBOT_CONTEXT_TOKENS // 2:
+            total -= window[split][1]
+            split += 1
+        try:
+            summary = _fold_into_summary(user_id, summary, window[:split])
+        except Exception as e:
+            # Without a fresh summary the turn still goes out with the trimmed window
+            db.session.rollback()
+            logger.error(f"Error summarizing conversation for user {user_id}: {str(e)}")
+        window = window[split:]
+
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    if summary is not None:
+        messages.append({"role": "system", "content": f"Summary of the earlier conversation: {summary.content}"})
+    messages.extend(_as_prompt_message(msg) for msg, _ in window)
+    messages.append({"role": "user", "content": message})
+    return messages
+
+
+def save_exchange(user_id, message, ai_response):
+    db.session.add(ChatMessage(user_id=user_id, content=message, is_bot=False))
+    db.session.add(ChatMessage(user_id=user_id, content=ai_response, is_bot=True))
+    db.session.commit()
+
 
 def get_or_create_message_history(user_id):
     if not user_id:
@@ -28,33 +148,15 @@ def get_chatbot_response(message, user_id):
     try:
         logger.debug(f"Received message from user {user_id}: {message}")
         
-        # Get existing chat history
-        history = get_conversation_history(user_id)
-        
-        full_prompt = {
-            "messages": [
-                {"role": "system", "content": "You are Dr. Gyno, a friendly and empathetic prenatal care expert."},
-                *[{"role": "user" if not msg['is_bot'] else "assistant", "content": msg['content']} for msg in history],
-                {"role": "user", "content": message},
-            ],
-            "model": "llama3-8b-8192",
-            "max_tokens": 500,
-            "temperature": 0.7
-        }
-
-        response = client.chat.completions.create(messages=full_prompt['messages'], model=full_prompt['model'])
+        # Summary of older turns plus the recent window
+        messages = build_context(user_id, message)
+
+        response = client.chat.completions.create(messages=messages, model=CHATBOT_MODEL)
 
         ai_response = response.choices[0].message.content
 
-        # Save user message
-        user_message = ChatMessage(user_id=user_id, content=message, is_bot=False)
-        db.session.add(user_message)
-        
-        # Save bot response
-        bot_message = ChatMessage(user_id=user_id, content=ai_response, is_bot=True)
-        db.session.add(bot_message)
-        
-        db.session.commit()
+        # Save the user message and the bot response
+        save_exchange(user_id, message, ai_response)
 
         logger.debug(f"Added new messages to history for user {user_id}")
 
@@ -64,20 +166,77 @@ def get_chatbot_response(message, user_id):
         logger.error(f"Error in getting chatbot response: {str(e)}")
         return "I'm sorry, I'm having trouble responding right now. Please try again later."
     
+def stream_chatbot_response(message, user_id):
+    """
+    Starts a streamed reply and returns a generator of its text chunks.
+
+    The context is built and the Groq stream opened before returning, so
+    those errors raise here. Both messages are saved once the stream has
+    been read to the end. If the generator is closed early (the client
+    disconnected), the Groq stream is closed and nothing is saved, so the
+    history never holds a reply the patient did not receive in full.
+    """
+    logger.debug(f"Received streamed message from user {user_id}: {message}")
+    messages = build_context(user_id, message)
+    stream = client.chat.completions.create(messages=messages, model=CHATBOT_MODEL, stream=True)
+
+    def generate():
+        parts = []
+        try:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                content = chunk.choices[0].delta.content
+                if content:
+                    parts.append(content)
+                    yield content
+        except GeneratorExit:
+            logger.debug(f"Stream for user {user_id} closed early; reply not saved")
+            raise
+        finally:
+            if hasattr(stream, 'close'):
+                stream.close()
+        save_exchange(user_id, message, "".join(parts))
+        logger.debug(f"Added new messages to history for user {user_id}")
+
+    return generate()
+
 def clear_conversation_history(user_id):
     logger.debug(f"Clearing conversation history for user {user_id}")
     ChatMessage.query.filter_by(user_id=user_id).delete()
+    ChatSummary.query.filter_by(user_id=user_id).delete()
     db.session.commit()
     logger.debug(f"Cleared conversation history for user {user_id}")
 
-def get_conversation_history(user_id):
+def get_conversation_history(user_id, limit=DEFAULT_PAGE_SIZE, cursor=None):
+    """
+    Returns one page of the user's messages, newest page first, using keyset
+    pagination on id. Ids increase in insertion order, and unlike the
+    server-set timestamps they never tie, so no page repeats or skips a row.
+
+    Args:
+        cursor (str): `next_cursor` of the previous page, or None for the newest page.
+
+    Returns:
+        tuple: (messages of the page in chronological order, cursor of the
+        next older page or None)
+    """
     logger.debug(f"Fetching conversation history for user {user_id}")
-    messages = ChatMessage.query.filter_by(user_id=user_id).order_by(ChatMessage.timestamp).all()
+    query = ChatMessage.query.filter_by(user_id=user_id)
+    if cursor:
+        query = query.filter(ChatMessage.id < decode_cursor(cursor))
+    messages = query.order_by(ChatMessage.id.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(messages) > limit:
+        messages = messages[:limit]
+        next_cursor = encode_cursor(messages[-1].id)
+
     history = [{
         'id': msg.id,
         'content': msg.content,
         'is_bot': msg.is_bot,
         'timestamp': msg.timestamp.replace(tzinfo=timezone.utc).isoformat()
-    } for msg in messages]
-    logger.debug(f"Returning history: {history}")
-    return history
\ No newline at end of file
+    } for msg in reversed(messages)]
+    logger.debug(f"Returning {len(history)} messages for user {user_id}")
+    return history, next_cursor
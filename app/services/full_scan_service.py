@@ -0,0 +1,90 @@
+import os
+import base64
+from concurrent.futures import ThreadPoolExecutor
+from app.services.ultrasound_classification_service import classify_pil_image, CLASSIFIER_MODEL_VERSION
+from app.services.head_circumference_service import (
+    load_model, preprocess_gray_array, generate_mask_and_circumference, HEAD_CIRCUMFERENCE_MODEL_VERSION
+)
+from app.services.anomaly_detection_service import detect_pil_image, DETECTION_MODEL_VERSION
+from app.services.image_enhancement_service import enhance_pil_image, ENHANCEMENT_MODEL_VERSION
+from app.utils.helpers import DecodedImage
+from app.utils.result_cache import image_digest, cached_result_for_digest
+
+FULL_SCAN_WORKERS = int(os.environ.get('FULL_SCAN_WORKERS', 4))
+
+executor = ThreadPoolExecutor(max_workers=FULL_SCAN_WORKERS, thread_name_prefix='full-scan')
+
+FULL_SCAN_ANALYSES = ('classification', 'circumference', 'detection', 'enhancement')
+
+
+def _b64(image_bytes):
+    return base64.b64encode(image_bytes).decode('utf-8')
+
+
+def _classification(decoded):
+    return classify_pil_image(decoded.rgb)
+
+
+def _circumference(decoded):
+    return generate_mask_and_circumference(load_model(), preprocess_gray_array(decoded.gray_array))
+
+
+def _detection(decoded):
+    return detect_pil_image(decoded.rgb)
+
+
+def _enhancement(decoded):
+    return enhance_pil_image(decoded.rgb)
+
+
+# name -> (cache namespace shared with the single-analysis endpoints, model version, runner)
+_ANALYSES = {
+    'classification': ('classify-ultrasound', CLASSIFIER_MODEL_VERSION, _classification),
+    'circumference': ('calculate-circumference', HEAD_CIRCUMFERENCE_MODEL_VERSION, _circumference),
+    'detection': ('detect-image', DETECTION_MODEL_VERSION, _detection),
+    'enhancement': ('enhance-image', ENHANCEMENT_MODEL_VERSION, _enhancement),
+}
+
+
+def _format_result(name, result):
+    if name == 'classification':
+        return result
+    if name == 'circumference':
+        mask_image_bytes, circumference, pixel_value = result
+        return {"circumference": circumference, "pixelValue": pixel_value, "maskImage": _b64(mask_image_bytes)}
+    if name == 'detection':
+        detected_image_bytes, detections = result
+        return {"detectedImage": _b64(detected_image_bytes), "detections": detections}
+    return {"enhancedImage": _b64(result)}
+
+
+def run_full_scan(image_bytes, analyses=FULL_SCAN_ANALYSES):
+    """
+    Decodes an ultrasound once and runs the requested analyses concurrently.
+
+    Results are shared with the single-analysis endpoints through the result
+    cache. A failing analysis does not fail the scan; its message is
+    reported under "errors" instead.
+
+    Returns:
+        dict: One entry per analysis plus an "errors" mapping.
+    """
+    decoded = DecodedImage(image_bytes)
+    digest = image_digest(image_bytes)
+
+    futures = {}
+    for name in analyses:
+        namespace, version, runner = _ANALYSES[name]
+        futures[name] = executor.submit(
+            cached_result_for_digest, namespace, version, digest, lambda runner=runner: runner(decoded)
+        )
+
+    response = {"errors": {}}
+    for name, future in futures.items():
+        try:
+            response[name] = _format_result(name, future.result())
+        except Exception as e:
+            print(f"Error in full scan {name}: {str(e)}")
+            response[name] = None
+            response["errors"][name] = str(e)
+    return response
@@ -1,15 +1,27 @@
 from app import db
 from app.models.gynecologist_message import GynecologistMessage
+from app.models.conversation import Conversation
 from app.models.pregnancy_info import PregnancyInfo
+from app.models.user import User
 from app.schemas.gynecologist_message_schema import gynecologist_messages_schema
-from sqlalchemy import func
+from app.utils.message_broker import get_broker
+from sqlalchemy import case, or_
+from sqlalchemy.exc import IntegrityError
 import logging
-from sqlalchemy.orm import aliased
+import os
+import time
 from datetime import datetime, timezone
 from flask import url_for
 
 logger = logging.getLogger(__name__)
 
+# Waiting requests re-check the database at least this often, which bounds the
+# delay for messages saved by another worker process
+MESSAGE_POLL_INTERVAL = float(os.environ.get('MESSAGE_POLL_INTERVAL', 5))
+
+def conversation_channel(patient_id, gynecologist_id):
+    return f"{int(gynecologist_id)}:{int(patient_id)}"
+
 def save_message(patient_id, gynecologist_id, content, is_from_patient):
     try:
         server_time = datetime.now()
@@ -26,21 +38,62 @@ def save_message(patient_id, gynecologist_id, content, is_from_patient):
             timestamp=utc_time
         )
         db.session.add(message)
+        db.session.flush()
+        _record_in_conversation(message)
         db.session.commit()
         
         print(f"Saved message timestamp: {message.timestamp}")
+        get_broker().publish(conversation_channel(patient_id, gynecologist_id), message.id)
         return message
     except Exception as e:
         logger.error(f"Error saving message: {str(e)}")
         db.session.rollback()
         raise
 
-def get_chat_history(patient_id, gynecologist_id):
+def _record_in_conversation(message):
+    """
+    Points the pair's Conversation at `message` and counts it as unread for
+    the recipient, in the caller's transaction. The pointer only moves
+    forward, so concurrent senders cannot leave it on an older message.
+    """
+    unread = Conversation.unread_by_gynecologist if message.is_from_patient else Conversation.unread_by_patient
+    newer = Conversation.last_message_id < message.id
+    values = {
+        Conversation.last_message_id: case((newer, message.id), else_=Conversation.last_message_id),
+        Conversation.last_message_at: case((newer, message.timestamp), else_=Conversation.last_message_at),
+        unread: unread + 1,
+    }
+    pair = Conversation.query.filter_by(gynecologist_id=message.gynecologist_id, patient_id=message.patient_id)
+    if pair.update(values, synchronize_session=False):
+        return
+
+    try:
+        with db.session.begin_nested():
+            db.session.add(Conversation(
+                gynecologist_id=message.gynecologist_id,
+                patient_id=message.patient_id,
+                last_message_id=message.id,
+                last_message_at=message.timestamp,
+                unread_by_gynecologist=1 if message.is_from_patient else 0,
+                unread_by_patient=0 if message.is_from_patient else 1,
+            ))
+    except IntegrityError:
+        # Another request created the row first
+        pair.update(values, synchronize_session=False)
+
+def get_chat_history(patient_id, gynecologist_id, since_id=None):
+    """
+    Returns the conversation's messages in order, or with `since_id` only
+    the messages newer than that id.
+    """
     try:
-        messages = GynecologistMessage.query.filter_by(
+        query = GynecologistMessage.query.filter_by(
             patient_id=patient_id,
             gynecologist_id=gynecologist_id
-        ).order_by(GynecologistMessage.timestamp.asc()).all()
+        )
+        if since_id is not None:
+            query = query.filter(GynecologistMessage.id > since_id)
+        messages = query.order_by(GynecologistMessage.timestamp.asc(), GynecologistMessage.id.asc()).all()
         
         return {
             "messages": [
@@ -58,29 +111,91 @@ def get_chat_history(patient_id, gynecologist_id):
         logger.error(f"Error fetching chat history: {str(e)}")
         raise
     
+def mark_messages_read(patient_id, gynecologist_id, reader, up_to_id):
+    """
+    Marks every message the other side sent in this conversation, up to and
+    including `up_to_id`, as read by `reader` ('gynecologist' or 'patient')
+    with one UPDATE, and lowers the conversation's unread counter to match.
+
+    Returns:
+        int: Number of messages newly marked as read.
+    """
+    if reader not in ('gynecologist', 'patient'):
+        raise ValueError("reader must be 'gynecologist' or 'patient'")
+    from_patient = reader == 'gynecologist'
+    try:
+        marked = GynecologistMessage.query.filter(
+            GynecologistMessage.gynecologist_id == gynecologist_id,
+            GynecologistMessage.patient_id == patient_id,
+            # Rows from before read receipts may have read = NULL, which counts as unread
+            or_(GynecologistMessage.read.is_(False), GynecologistMessage.read.is_(None)),
+            GynecologistMessage.is_from_patient.is_(from_patient),
+            GynecologistMessage.id <= up_to_id,
+        ).update({GynecologistMessage.read: True}, synchronize_session=False)
+
+        if marked:
+            unread = Conversation.unread_by_gynecologist if from_patient else Conversation.unread_by_patient
+            Conversation.query.filter_by(
+                gynecologist_id=gynecologist_id, patient_id=patient_id
+            ).update({unread: case((unread > marked, unread - marked), else_=0)}, synchronize_session=False)
+        db.session.commit()
+        return marked
+    except Exception as e:
+        logger.error(f"Error marking messages read: {str(e)}")
+        db.session.rollback()
+        raise
+
+def get_gynecologist_unread_counts(gynecologist_id):
+    """Unread message counts per patient for a gynecologist, read from the conversation table."""
+    rows = db.session.query(Conversation.patient_id, Conversation.unread_by_gynecologist).filter(
+        Conversation.gynecologist_id == gynecologist_id,
+        Conversation.unread_by_gynecologist > 0
+    ).all()
+    return {
+        "total": sum(count for _, count in rows),
+        "conversations": [{"patient_id": patient_id, "unread_count": count} for patient_id, count in rows]
+    }
+
+def get_patient_unread_count(patient_id):
+    total = db.session.query(db.func.coalesce(db.func.sum(Conversation.unread_by_patient), 0)).filter(
+        Conversation.patient_id == patient_id
+    ).scalar()
+    return {"total": int(total)}
+
+def wait_for_messages(patient_id, gynecologist_id, since_id, timeout):
+    """
+    Returns the messages newer than `since_id`, waiting up to `timeout`
+    seconds for one to be sent if there are none yet.
+    """
+    channel = conversation_channel(patient_id, gynecologist_id)
+    deadline = time.monotonic() + timeout
+    while True:
+        messages = get_chat_history(patient_id, gynecologist_id, since_id)["messages"]
+        # Do not hold a connection while waiting
+        db.session.close()
+        remaining = deadline - time.monotonic()
+        if messages or remaining <= 0:
+            return messages
+        get_broker().wait(channel, since_id, min(remaining, MESSAGE_POLL_INTERVAL))
+
 def get_gynecologist_conversations(gynecologist_id, page=1, per_page=20):
     try:
-        subquery = db.session.query(
-            GynecologistMessage.patient_id,
-            func.max(GynecologistMessage.timestamp).label('last_message_time')
-        ).filter_by(gynecologist_id=gynecologist_id).group_by(GynecologistMessage.patient_id).subquery()
-        
-        LastMessage = aliased(GynecologistMessage)
-        
-        query = db.session.query(LastMessage).join(
-            subquery,
-            db.and_(
-                LastMessage.patient_id == subquery.c.patient_id,
-                LastMessage.timestamp == subquery.c.last_message_time
-            )
-        ).filter(LastMessage.gynecologist_id == gynecologist_id).order_by(subquery.c.last_message_time.desc())
+        # Conversations are read newest first straight off the (gynecologist_id, last_message_at)
+        # index, together with their last message, patient and pregnancy info
+        query = db.session.query(Conversation, GynecologistMessage, User, PregnancyInfo).join(
+            GynecologistMessage, GynecologistMessage.id == Conversation.last_message_id
+        ).join(
+            User, User.id == Conversation.patient_id
+        ).outerjoin(
+            PregnancyInfo, PregnancyInfo.user_id == Conversation.patient_id
+        ).filter(
+            Conversation.gynecologist_id == gynecologist_id
+        ).order_by(Conversation.last_message_at.desc(), Conversation.id.desc())
 
-        paginated_messages = query.paginate(page=page, per_page=per_page, error_out=False)
+        paginated_conversations = query.paginate(page=page, per_page=per_page, error_out=False)
 
         result = []
-        for message in paginated_messages.items:
-            pregnancy_info = PregnancyInfo.query.filter_by(user_id=message.patient_id).first()
-            patient = message.patient
+        for conversation, message, patient, pregnancy_info in paginated_conversations.items:
             result.append({
                 "patient_id": patient.id,
                 "patient_name": patient.full_name,
@@ -91,15 +206,16 @@ def get_gynecologist_conversations(gynecologist_id, page=1, per_page=20):
                     "timestamp": message.timestamp.isoformat()
                 },
                 "pregnancy_week": pregnancy_info.get_current_week() if pregnancy_info else None,
-                "last_message_time": message.timestamp.isoformat()
+                "last_message_time": message.timestamp.isoformat(),
+                "unread_count": conversation.unread_by_gynecologist
             })
 
         return {
             "conversations": result,
-            "total": paginated_messages.total,
-            "pages": paginated_messages.pages,
+            "total": paginated_conversations.total,
+            "pages": paginated_conversations.pages,
             "current_page": page
         }
     except Exception as e:
         logger.error(f"Error fetching gynecologist conversations: {str(e)}")
-        raise
\ No newline at end of file
+        raise
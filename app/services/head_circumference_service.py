@@ -3,15 +3,19 @@ import numpy as np
 import cv2
 import os
 import traceback
+from bisect import bisect_left
 from torchvision import transforms
-from app.models.modelCSM import CSM
+from app.models.modelCSM import CSM, optimize_for_inference
+from app.utils.model_registry import get_model
+from app.utils.result_cache import file_version
+from app.utils.helpers import DecodedImage, encode_image
 from PIL import Image
 from flask import url_for
 import base64
 from io import BytesIO
 
 
-def generate_mask_and_circumference(model, image_tensor):
+def generate_mask_and_circumference(model, image_tensor, image_format='PNG'):
     try:
         print("Generating mask and calculating head circumference...")
         with torch.no_grad():
@@ -43,10 +47,7 @@ def generate_mask_and_circumference(model, image_tensor):
         circumference = 2 * np.pi * np.sqrt((a**2 + b**2) / 2)
         print(f"Calculated circumference: {circumference}")
         # Convert mask to image bytes
-        mask_pil = Image.fromarray(mask_image)
-        buffer = BytesIO()
-        mask_pil.save(buffer, format="PNG")
-        mask_image_bytes = buffer.getvalue()
+        mask_image_bytes = encode_image(mask_image, image_format)
 
         # Optional: Calculate pixel value or any other relevant value
         pixel_value = np.mean(mask_image)  # Example pixel value calculation
@@ -58,16 +59,23 @@ def generate_mask_and_circumference(model, image_tensor):
         raise
 
 
-# Load the model
+HEAD_CIRCUMFERENCE_MODEL_PATH = 'app/models/test_model.pth'
+HEAD_CIRCUMFERENCE_MODEL_VERSION = file_version(HEAD_CIRCUMFERENCE_MODEL_PATH)
+
+# Load the model once per worker; every request shares the same instance
 def load_model():
+    return get_model('head_circumference', _load_csm_model)
+
+def _load_csm_model():
     try:
         print("Loading model...")
-        model_path = 'app/models/test_model.pth'
+        model_path = HEAD_CIRCUMFERENCE_MODEL_PATH
         
-        model = CSM()  
+        # Only the stage-1 mask is used, so the later stages are never computed
+        model = CSM(output_stage=1)
         state_dict = torch.load(model_path, map_location=torch.device('cpu'))
         model.load_state_dict(state_dict)
-        model.eval()
+        optimize_for_inference(model)
         
         print("Model loaded successfully.")
         return model
@@ -79,25 +87,21 @@ def load_model():
 # Preprocess the image
 def preprocess_image(image_bytes):
     try:
-        np_array = np.frombuffer(image_bytes, np.uint8)
-        image = cv2.imdecode(np_array, cv2.IMREAD_GRAYSCALE)
-
-        if image is None:
-            raise ValueError("Image decoding failed")
-
-        desired_size = (192, 128)
-        resized_image = cv2.resize(image, desired_size)
-        normalized_image = resized_image / 255.0
-        processed_image = np.expand_dims(normalized_image, axis=0)  # Add channel dimension
-        processed_image = np.expand_dims(processed_image, axis=0)  # Add batch dimension
-        processed_image = torch.tensor(processed_image, dtype=torch.float32)
-
-        return processed_image
+        return preprocess_gray_array(DecodedImage(image_bytes).gray_array)
     except Exception as e:
         print(f"Error during image preprocessing: {str(e)}")
         traceback.print_exc()
         return None
 
+def preprocess_gray_array(image):
+    """Builds the model input tensor from a decoded 8-bit grayscale array."""
+    desired_size = (192, 128)
+    resized_image = cv2.resize(image, desired_size)
+    normalized_image = resized_image / 255.0
+    processed_image = np.expand_dims(normalized_image, axis=0)  # Add channel dimension
+    processed_image = np.expand_dims(processed_image, axis=0)  # Add batch dimension
+    return torch.tensor(processed_image, dtype=torch.float32)
+
 
 def calculate_circumference_from_mask(mask_image):
     """
@@ -234,36 +238,59 @@ def ellip_fit(edge_image):
     return xc, yc, theta, a, b
 
 
+# Upper bound (cm, inclusive) of each gestational-age band. Each band runs up
+# to the next band's lower bound so that no circumference falls between bands.
+FETAL_AGE_BANDS = [
+    (np.nextafter(8.00, -np.inf), 'Fetus is less than 8 Menstrual Weeks'),
+    (9.00, '13 Weeks'),
+    (10.50, '14 Weeks'),
+    (12.50, '15 Weeks'),
+    (13.50, '16 Weeks'),
+    (15.00, '17 Weeks'),
+    (16.50, '18 Weeks'),
+    (17.50, '19 Weeks'),
+    (19.00, '20 Weeks'),
+    (20.00, '21 Weeks'),
+    (21.00, '22 Weeks'),
+    (22.50, '23 Weeks'),
+    (np.nextafter(23.00, -np.inf), '24 Weeks'),
+    (24.00, '25 Weeks'),
+    (24.80, '26 Weeks'),
+    (25.61, '27 Weeks'),
+    (26.76, '28 Weeks'),
+    (27.76, '29 Weeks'),
+    (28.86, '30 Weeks'),
+    (29.61, '31 Weeks'),
+    (30.41, '32 Weeks'),
+    (31.21, '33 Weeks'),
+    (31.81, '34 Weeks'),
+    (32.51, '35 Weeks'),
+    (33.01, '36 Weeks'),
+    (33.71, '37 Weeks'),
+    (34.21, '38 Weeks'),
+    (35.00, '39 Weeks'),
+    (36.00, '40 Weeks'),
+]
+FETAL_AGE_UPPER_BOUNDS = np.array([bound for bound, _ in FETAL_AGE_BANDS], dtype=np.float64)
+FETAL_AGE_LABELS = np.array([label for _, label in FETAL_AGE_BANDS] + ['Abnormal'], dtype=object)
+_fetal_age_bounds = FETAL_AGE_UPPER_BOUNDS.tolist()
+
+
 def calculate_fetal_age(head_circumference_cm):
-    if head_circumference_cm < 8.00: return 'Fetus is less than 8 Menstrual Weeks'
-    if head_circumference_cm >= 8.00 and head_circumference_cm <= 9.00: return '13 Weeks'
-    if head_circumference_cm > 9.00 and head_circumference_cm <= 10.49: return '14 Weeks'
-    if head_circumference_cm > 10.50 and head_circumference_cm <= 12.49: return '15 Weeks'
-    if head_circumference_cm > 12.50 and head_circumference_cm <= 13.49: return '16 Weeks'
-    if head_circumference_cm > 13.50 and head_circumference_cm <= 14.99: return '17 Weeks'
-    if head_circumference_cm > 15.00 and head_circumference_cm <= 16.49: return '18 Weeks'
-    if head_circumference_cm > 16.50 and head_circumference_cm <= 17.49: return '19 Weeks'
-    if head_circumference_cm > 17.50 and head_circumference_cm <= 18.99: return '20 Weeks'
-    if head_circumference_cm > 19.00 and head_circumference_cm <= 19.99: return '21 Weeks'
-    if head_circumference_cm > 20.00 and head_circumference_cm <= 20.99: return '22 Weeks'
-    if head_circumference_cm > 21.00 and head_circumference_cm <= 22.49: return '23 Weeks'
-    if head_circumference_cm > 22.50 and head_circumference_cm <= 22.99: return '24 Weeks'
-    if head_circumference_cm >= 23.00 and head_circumference_cm <= 23.99: return '25 Weeks'
-    if head_circumference_cm > 24.00 and head_circumference_cm <= 24.79: return '26 Weeks'
-    if head_circumference_cm > 24.80 and head_circumference_cm <= 25.60: return '27 Weeks'
-    if head_circumference_cm > 25.61 and head_circumference_cm <= 26.75: return '28 Weeks'
-    if head_circumference_cm > 26.76 and head_circumference_cm <= 27.75: return '29 Weeks'
-    if head_circumference_cm > 27.76 and head_circumference_cm <= 28.85: return '30 Weeks'
-    if head_circumference_cm > 28.86 and head_circumference_cm <= 29.60: return '31 Weeks'
-    if head_circumference_cm > 29.61 and head_circumference_cm <= 30.40: return '32 Weeks'
-    if head_circumference_cm > 30.41 and head_circumference_cm <= 31.20: return '33 Weeks'
-    if head_circumference_cm > 31.21 and head_circumference_cm <= 31.80: return '34 Weeks'
-    if head_circumference_cm > 31.81 and head_circumference_cm <= 32.50: return '35 Weeks'
-    if head_circumference_cm > 32.51 and head_circumference_cm <= 33.00: return '36 Weeks'
-    if head_circumference_cm > 33.01 and head_circumference_cm <= 33.70: return '37 Weeks'
-    if head_circumference_cm > 33.71 and head_circumference_cm <= 34.20: return '38 Weeks'
-    if head_circumference_cm > 34.21 and head_circumference_cm <= 35.00: return '39 Weeks'
-    if head_circumference_cm > 35.00 and head_circumference_cm <= 36.00: return '40 Weeks'
-    return 'Abnormal'
+    """Maps a head circumference in cm to its gestational-age label."""
+    head_circumference_cm = float(head_circumference_cm)
+    if np.isnan(head_circumference_cm):
+        return 'Abnormal'
+    return FETAL_AGE_LABELS[bisect_left(_fetal_age_bounds, head_circumference_cm)]
+
 
+def calculate_fetal_ages(head_circumferences_cm):
+    """
+    Vectorized calculate_fetal_age for a sequence or array of circumferences.
 
+    Returns:
+        np.ndarray: The gestational-age labels, with the same shape as the input.
+    """
+    values = np.asarray(head_circumferences_cm, dtype=np.float64)
+    # NaN sorts after every bound, so it lands on 'Abnormal' like out-of-range values
+    return FETAL_AGE_LABELS[np.searchsorted(FETAL_AGE_UPPER_BOUNDS, values, side='left')]
@@ -1,21 +1,151 @@
+import os
 import pickle
 import warnings
+import numpy as np
+
+# Request fields in the order the model was trained on
+HEALTH_FEATURES = ('age', 'systolic_bp', 'diastolic_bp', 'bs', 'bt', 'heart_rate')
+HEALTH_TRACKING_MAX_BATCH = int(os.environ.get('HEALTH_TRACKING_MAX_BATCH', 10000))
+# Larger batches go to sklearn, whose compiled tree walk wins once its
+# per-call validation cost is spread over enough rows
+COMPILED_TREE_MAX_ROWS = int(os.environ.get('COMPILED_TREE_MAX_ROWS', 256))
 
 # Load the trained model
 with open('app/models/decision_tree_model.pkl', 'rb') as file:
     model = pickle.load(file)
 
 
-def predict_health_risk(features):
-    try:
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore", UserWarning)
-            prediction = model.predict(features)
-            if prediction[0] == 1:
-                return "Low Risk"
-            elif prediction[0] == 0:
-                return "High Risk"
+class CompiledTree:
+    """
+    A fitted sklearn decision tree flattened into NumPy arrays.
+
+    A single row walks the tree with plain Python lists. A batch is scored
+    without walking at all: every split is compared for every row in one
+    step, and a row lands in the leaf whose path conditions all hold,
+    which is one matrix product against a (split, leaf) path matrix. Like
+    sklearn, features are compared as float32 against the thresholds.
+    """
+
+    def __init__(self, estimator):
+        tree = estimator.tree_
+        self.classes = estimator.classes_
+
+        value = tree.value[:, 0, :].astype(np.float64)
+        totals = value.sum(axis=1, keepdims=True)
+        self.probabilities = np.divide(value, totals, out=np.zeros_like(value), where=totals > 0)
+
+        # Flat arrays for the single-row walk
+        self._feature = tree.feature.tolist()
+        self._threshold = tree.threshold.tolist()
+        self._children_left = tree.children_left.tolist()
+        self._children_right = tree.children_right.tolist()
+
+        # Path matrix for batches: +1 where a leaf needs the split to go left,
+        # -1 where it needs it to go right
+        self.leaves = np.flatnonzero(tree.children_left < 0)
+        self.splits = np.flatnonzero(tree.children_left >= 0)
+        self.split_feature = tree.feature[self.splits]
+        self.split_threshold = tree.threshold[self.splits]
+        split_index = {node: i for i, node in enumerate(self.splits)}
+        leaf_index = {node: i for i, node in enumerate(self.leaves)}
+        self.paths = np.zeros((len(self.splits), len(self.leaves)), dtype=np.float32)
+        self.left_turns = np.zeros(len(self.leaves), dtype=np.float32)
+
+        stack = [(0, [])]
+        while stack:
+            node, path = stack.pop()
+            if node in leaf_index:
+                for split, left in path:
+                    self.paths[split_index[split], leaf_index[node]] = 1 if left else -1
+                self.left_turns[leaf_index[node]] = sum(left for _, left in path)
+                continue
+            stack.append((self._children_left[node], path + [(node, True)]))
+            stack.append((self._children_right[node], path + [(node, False)]))
+
+    def _apply_row(self, row):
+        row = np.asarray(row, dtype=np.float32).tolist()
+        node = 0
+        while self._children_left[node] >= 0:
+            if row[self._feature[node]] <= self._threshold[node]:
+                node = self._children_left[node]
             else:
-                return "Medium Risk"
+                node = self._children_right[node]
+        return node
+
+    def apply(self, X):
+        """Index of the leaf each row of `X` lands in."""
+        X = np.asarray(X, dtype=np.float32)
+        if X.shape[0] == 1:
+            return np.array([self._apply_row(X[0])], dtype=np.intp)
+        # A row satisfies every condition on a leaf's path exactly when its
+        # score equals the number of left turns on that path; other leaves score lower.
+        went_left = (X[:, self.split_feature] <= self.split_threshold).astype(np.float32)
+        return self.leaves[np.argmax(went_left @ self.paths - self.left_turns, axis=1)]
+
+    def predict_proba(self, X):
+        return self.probabilities[self.apply(X)]
+
+    def predict(self, X):
+        return self.classes[np.argmax(self.predict_proba(X), axis=1)]
+
+
+def _compile(estimator):
+    # Anything that is not a plain fitted tree (e.g. a pipeline) is scored by sklearn
+    if not hasattr(estimator, 'tree_'):
+        print(f"Health risk model {type(estimator).__name__} is not a single tree; using sklearn")
+        return None
+    return CompiledTree(estimator)
+
+
+compiled_model = _compile(model)
+
+
+def risk_label(prediction):
+    if prediction == 1:
+        return "Low Risk"
+    elif prediction == 0:
+        return "High Risk"
+    else:
+        return "Medium Risk"
+
+
+def _predict_proba(features):
+    if compiled_model is not None and len(features) <= COMPILED_TREE_MAX_ROWS:
+        return compiled_model.predict_proba(features), compiled_model.classes
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        return model.predict_proba(features), model.classes_
+
+
+def predict_health_risks(features):
+    """
+    Scores a batch of vitals.
+
+    Args:
+        features (array-like): One row per patient, columns in HEALTH_FEATURES order.
+
+    Returns:
+        list[dict]: For each row the risk level, the probability of that
+        level and the probability of every level.
+    """
+    try:
+        features = np.asarray(features, dtype=np.float64)
+        if features.ndim != 2 or features.shape[1] != len(HEALTH_FEATURES):
+            raise ValueError(f"Expected rows of {len(HEALTH_FEATURES)} features, got shape {features.shape}")
+        if features.shape[0] == 0:
+            return []
+
+        probabilities, classes = _predict_proba(features)
+        best = np.argmax(probabilities, axis=1).tolist()
+        labels = [risk_label(c) for c in classes]
+        return [
+            {
+                "risk_level": labels[index],
+                "confidence": row[index],
+                "probabilities": dict(zip(labels, row)),
+            }
+            for index, row in zip(best, probabilities.tolist())
+        ]
     except Exception as e:
         raise RuntimeError(f"Error in prediction: {str(e)}")
+
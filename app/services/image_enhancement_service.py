@@ -1,28 +1,39 @@
 import os
-import onnxruntime as ort
 import numpy as np
 from PIL import Image, ImageOps, ImageFilter
-from io import BytesIO
+from app.utils.result_cache import file_version
+from app.utils.helpers import DecodedImage, encode_image
+from app.utils.model_registry import get_model, create_onnx_session
 
 model_file = 'app/models/ImageEnhancement.onnx'  # Update with your actual model path
+ENHANCEMENT_MODEL_VERSION = file_version(model_file)
+
+# Tiled mode runs the 64x64 autoencoder over overlapping patches of the full-resolution image
+ENHANCEMENT_TILE_SIZE = 64
+ENHANCEMENT_TILE_OVERLAP = int(os.environ.get('ENHANCEMENT_TILE_OVERLAP', 16))
+ENHANCEMENT_TILE_BATCH_SIZE = int(os.environ.get('ENHANCEMENT_TILE_BATCH_SIZE', 256))
 
 def load_enhancement_model():
-    if not os.path.exists(model_file):
-        raise FileNotFoundError(f"The model file {model_file} does not exist.")
-    
-    session = ort.InferenceSession(model_file)
+    return get_model('image_enhancement', _create_enhancement_session)
+
+def _create_enhancement_session():
+    session = create_onnx_session(model_file)
     # Print the shape of the model's input tensor for debugging
     input_shape = session.get_inputs()[0].shape
     print(f"Model input shape: {input_shape}")
     return session
 
-def enhance_image(image_bytes):
+def enhance_image(image_bytes, image_format='PNG'):
+    return enhance_pil_image(DecodedImage(image_bytes).rgb, image_format)
+
+def enhance_image_tiled(image_bytes, image_format='PNG'):
+    return enhance_pil_image_tiled(DecodedImage(image_bytes).rgb, image_format)
+
+def enhance_pil_image(image, image_format='PNG'):
     try:
         session = load_enhancement_model()
         print("Model loaded successfully.")
 
-        # Load and preprocess the image
-        image = Image.open(BytesIO(image_bytes)).convert('RGB')
         original_size = image.size
         
         # Optionally apply denoising
@@ -57,13 +68,84 @@ def enhance_image(image_bytes):
         # Optionally apply upscaling
         enhanced_image = enhanced_image.resize(original_size, Image.Resampling.BICUBIC)
         
-        # Save the enhanced image to bytes
-        enhanced_image_bytes = BytesIO()
-        enhanced_image.save(enhanced_image_bytes, format='PNG')
-        enhanced_image_bytes.seek(0)
-        
-        return enhanced_image_bytes.getvalue()  # Return bytes
+        # Encode the enhanced image to bytes
+        return encode_image(enhanced_image, image_format)
 
     except Exception as e:
         print(f"Error in enhance_image: {str(e)}")
         raise e
+
+def _tile_origins(length, tile_size, stride):
+    """Start offsets of tiles covering [0, length), the last one flush with the end."""
+    if length <= tile_size:
+        return [0]
+    origins = list(range(0, length - tile_size, stride))
+    origins.append(length - tile_size)
+    return origins
+
+def _blend_window(tile_size, overlap):
+    """
+    Per-pixel tile weights that ramp up linearly across the overlap, so
+    neighbouring tiles cross-fade instead of leaving visible seams.
+    """
+    ramp = np.ones(tile_size, dtype=np.float32)
+    if overlap > 0:
+        edge = (np.arange(overlap, dtype=np.float32) + 0.5) / overlap
+        ramp[:overlap] = edge
+        ramp[-overlap:] = np.minimum(ramp[-overlap:], edge[::-1])
+    return np.outer(ramp, ramp)
+
+def _iter_tile_batches(image, origins, batch_size):
+    """Yields (origins, NHWC float32 batch) so only one batch of tiles is in memory."""
+    tile_size = ENHANCEMENT_TILE_SIZE
+    for start in range(0, len(origins), batch_size):
+        batch_origins = origins[start:start + batch_size]
+        batch = np.empty((len(batch_origins), tile_size, tile_size, 1), dtype=np.float32)
+        for i, (y, x) in enumerate(batch_origins):
+            batch[i, :, :, 0] = image[y:y + tile_size, x:x + tile_size]
+        yield batch_origins, batch
+
+def enhance_pil_image_tiled(image, image_format='PNG'):
+    """
+    Enhances the image at its original resolution by running the autoencoder
+    over overlapping 64x64 tiles in batches and blending the results.
+    """
+    try:
+        session = load_enhancement_model()
+        input_name = session.get_inputs()[0].name
+        tile_size = ENHANCEMENT_TILE_SIZE
+        overlap = min(max(ENHANCEMENT_TILE_OVERLAP, 0), tile_size // 2)
+
+        image = image.filter(ImageFilter.MedianFilter(size=3))
+        grayscale = np.asarray(ImageOps.grayscale(image), dtype=np.float32) / 255.0
+        height, width = grayscale.shape
+
+        # Images smaller than a tile are padded up to one tile and cropped afterwards
+        pad_height, pad_width = max(0, tile_size - height), max(0, tile_size - width)
+        if pad_height or pad_width:
+            grayscale = np.pad(grayscale, ((0, pad_height), (0, pad_width)), mode='edge')
+        padded_height, padded_width = grayscale.shape
+
+        stride = tile_size - overlap
+        origins = [(y, x)
+                   for y in _tile_origins(padded_height, tile_size, stride)
+                   for x in _tile_origins(padded_width, tile_size, stride)]
+        window = _blend_window(tile_size, overlap)
+
+        output = np.zeros((padded_height, padded_width), dtype=np.float32)
+        weights = np.zeros((padded_height, padded_width), dtype=np.float32)
+        for batch_origins, batch in _iter_tile_batches(grayscale, origins, ENHANCEMENT_TILE_BATCH_SIZE):
+            predictions = session.run(None, {input_name: batch})[0]
+            predictions = predictions.reshape(len(batch_origins), tile_size, tile_size)
+            for (y, x), tile in zip(batch_origins, predictions):
+                output[y:y + tile_size, x:x + tile_size] += tile * window
+                weights[y:y + tile_size, x:x + tile_size] += window
+
+        output /= weights
+        enhanced_array = np.clip(output[:height, :width] * 255.0, 0, 255).astype(np.uint8)
+
+        return encode_image(enhanced_array, image_format)
+
+    except Exception as e:
+        print(f"Error in enhance_image_tiled: {str(e)}")
+        raise e
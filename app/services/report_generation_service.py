@@ -1,8 +1,8 @@
 import io
 import base64
+import hashlib
 import os
-import uuid
-from datetime import datetime
+from functools import lru_cache
 import google.generativeai as genai
 import markdown
 from bs4 import BeautifulSoup
@@ -11,6 +11,9 @@ from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_JUSTIFY
 from reportlab.lib.units import inch
+from PIL import Image
+from app.utils.result_cache import cached_result
+from app.utils.artifact_store import ArtifactStore, content_key
 
 api_key = os.environ.get('GOOGLE_AI_API_KEY')
 genai.configure(api_key=api_key)
@@ -22,13 +25,14 @@ generation_config = {
     "max_output_tokens": 8192,
 }
 
+REPORT_MODEL_NAME = "gemini-1.5-pro-latest"
+
 model = genai.GenerativeModel(
-    model_name="gemini-1.5-pro-latest",
+    model_name=REPORT_MODEL_NAME,
     generation_config=generation_config
 )
 
-def describe_image(image):
-    prompt = """
+REPORT_PROMPT = """
     You are an expert in medical image analysis with a focus on ultrasound images. 
     Your task is to examine the uploaded ultrasound image for any anomalies, conditions, or findings. 
     Please provide a detailed analysis and report based on the following guidelines: 
@@ -42,82 +46,132 @@ def describe_image(image):
     - If the image is unclear or of low quality, mention that certain aspects cannot be determined. 
     - Include a disclaimer: "Consult with a Doctor before making any decisions."
     """
-    try:
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        max_size = (1024, 1024)
-        image.thumbnail(max_size)
-        buffered = io.BytesIO()
-        image.save(buffered, format="PNG")
-        img_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
-        response = model.generate_content([
-            {"mime_type": "image/png", "data": img_base64},
-            prompt
-        ])
-        
-        html = markdown.markdown(response.text)
-        
-        soup = BeautifulSoup(html, 'html.parser')
-        
-        style = soup.new_tag('style')
-        style.string = """
-            body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
-            h1, h2, h3 { color: #2c3e50; }
-            strong { color: #e74c3c; }
-            ul { padding-left: 20px; }
-            .disclaimer { background-color: #f8f9fa; border-left: 5px solid #ccc; padding: 10px; margin-top: 20px; }
-        """
-        soup.insert(0, style)
-        
-        disclaimer = soup.find(string=lambda text: "Disclaimer:" in text if text else False)
-        if disclaimer:
-            disclaimer_tag = disclaimer.find_parent()
-            new_div = soup.new_tag('div', attrs={'class': 'disclaimer'})
-            disclaimer_tag.wrap(new_div)
-        
-        return str(soup)
-    except Exception as e:
-        return f"<p>An unexpected error occurred: {str(e)}</p>"
 
-def generate_pdf(html_content):
-    filename = f"report_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.pdf"
+# Cached reports are tied to the Gemini model and prompt that produced them
+REPORT_VERSION = f"{REPORT_MODEL_NAME}:{hashlib.sha256(REPORT_PROMPT.encode('utf-8')).hexdigest()[:12]}"
+
+def analyze_image(image):
+    """Asks Gemini for a report on the image and returns it as styled HTML."""
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    max_size = (1024, 1024)
+    image.thumbnail(max_size)
+    buffered = io.BytesIO()
+    image.save(buffered, format="PNG")
+    img_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
+    response = model.generate_content([
+        {"mime_type": "image/png", "data": img_base64},
+        REPORT_PROMPT
+    ])
     
-    os.makedirs('static/reports', exist_ok=True)
+    html = markdown.markdown(response.text)
     
-    filepath = os.path.join('static/reports', filename)
+    soup = BeautifulSoup(html, 'html.parser')
     
-    # Create a PDF document
-    doc = SimpleDocTemplate(filepath, pagesize=letter,
-                            rightMargin=72, leftMargin=72,
-                            topMargin=72, bottomMargin=18)
+    style = soup.new_tag('style')
+    style.string = """
+        body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
+        h1, h2, h3 { color: #2c3e50; }
+        strong { color: #e74c3c; }
+        ul { padding-left: 20px; }
+        .disclaimer { background-color: #f8f9fa; border-left: 5px solid #ccc; padding: 10px; margin-top: 20px; }
+    """
+    soup.insert(0, style)
     
-    # Create a list to hold the flowables
-    Story = []
+    disclaimer = soup.find(string=lambda text: "Disclaimer:" in text if text else False)
+    if disclaimer:
+        disclaimer_tag = disclaimer.find_parent()
+        new_div = soup.new_tag('div', attrs={'class': 'disclaimer'})
+        disclaimer_tag.wrap(new_div)
     
-    # Define styles
+    return str(soup)
+
+def analyze_image_bytes(image_bytes):
+    """
+    analyze_image for raw upload bytes; reports for an identical image are
+    served from the result cache instead of calling Gemini again.
+    """
+    return cached_result('generate-report', REPORT_VERSION, image_bytes,
+                         lambda: analyze_image(Image.open(io.BytesIO(image_bytes))))
+
+def describe_image_bytes(image_bytes):
+    try:
+        return analyze_image_bytes(image_bytes)
+    except Exception as e:
+        return f"<p>An unexpected error occurred: {str(e)}</p>"
+
+REPORT_DIRECTORY = 'static/reports'
+REPORT_STORE_MAX_BYTES = int(os.environ.get('REPORT_STORE_MAX_BYTES', 512 * 1024 * 1024))
+REPORT_STORE_MAX_AGE_SECONDS = int(os.environ.get('REPORT_STORE_MAX_AGE_SECONDS', 30 * 24 * 3600))
+# Bump when the HTML -> PDF layout changes so stored PDFs are rendered again
+PDF_LAYOUT_VERSION = '1'
+# Parsed report HTML kept in memory, so re-rendering a report does not parse it again
+REPORT_PARSE_CACHE_SIZE = int(os.environ.get('REPORT_PARSE_CACHE_SIZE', 64))
+
+report_store = ArtifactStore(REPORT_DIRECTORY, '.pdf', REPORT_STORE_MAX_BYTES, REPORT_STORE_MAX_AGE_SECONDS)
+
+@lru_cache(maxsize=1)
+def report_styles():
+    """The report stylesheet, built once; reportlab styles are not mutated while rendering."""
     styles = getSampleStyleSheet()
     styles.add(ParagraphStyle(name='Justify', alignment=TA_JUSTIFY))
-    
-    # Parse the HTML content
+    return styles
+
+@lru_cache(maxsize=REPORT_PARSE_CACHE_SIZE)
+def _report_blocks(html_content):
+    """
+    The report HTML parsed once into (style name or None for a spacer, text)
+    blocks. Flowables are rebuilt from these on every render, since reportlab
+    mutates them while laying out a document.
+    """
+    blocks = []
     soup = BeautifulSoup(html_content, 'html.parser')
-    
-    # Process each element in the HTML
     for element in soup.find_all(['h1', 'h2', 'h3', 'p', 'ul']):
         if element.name in ['h1', 'h2', 'h3']:
-            Story.append(Paragraph(element.text, styles['Heading' + element.name[-1]]))
+            blocks.append(('Heading' + element.name[-1], element.text))
         elif element.name == 'p':
-            Story.append(Paragraph(element.text, styles['Normal']))
+            blocks.append(('Normal', element.text))
         elif element.name == 'ul':
             for li in element.find_all('li'):
-                Story.append(Paragraph('• ' + li.text, styles['Normal']))
-        Story.append(Spacer(1, 0.2 * inch))
-    
-    # Build the PDF
-    doc.build(Story)
-    
-    return filename
+                blocks.append(('Normal', '• ' + li.text))
+        blocks.append((None, None))
+    return tuple(blocks)
+
+def html_to_flowables(html_content, styles=None):
+    """Converts report HTML (headings, paragraphs and bullet lists) into reportlab flowables."""
+    styles = styles or report_styles()
+    return [Paragraph(text, styles[style]) if style else Spacer(1, 0.2 * inch)
+            for style, text in _report_blocks(html_content)]
+
+def render_pdf(html_content):
+    """Renders report HTML to PDF bytes in memory."""
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter,
+                            rightMargin=72, leftMargin=72,
+                            topMargin=72, bottomMargin=18)
+    doc.build(html_to_flowables(html_content))
+    return buffer.getvalue()
+
+def report_pdf_key(html_content):
+    return content_key(PDF_LAYOUT_VERSION, html_content)
+
+def report_pdf_file(pdf_filename):
+    """Absolute path of a PDF named by generate_pdf."""
+    return os.path.abspath(os.path.join(report_store.directory, pdf_filename))
+
+def generate_pdf(html_content):
+    """Stores the PDF for the HTML and returns its filename under static/reports."""
+    key = report_pdf_key(html_content)
+    report_store.get_or_create(key, lambda: render_pdf(html_content))
+    return report_store.filename(key)
+
+def create_report_from_bytes(image_bytes):
+    html_content = describe_image_bytes(image_bytes)
+    pdf_filename = generate_pdf(html_content)
+    return html_content, pdf_filename
 
-def create_report(image):
-    html_content = describe_image(image)
+def build_report(image_bytes):
+    """create_report_from_bytes that raises instead of reporting the error in the HTML."""
+    html_content = analyze_image_bytes(image_bytes)
     pdf_filename = generate_pdf(html_content)
     return html_content, pdf_filename
\ No newline at end of file
@@ -0,0 +1,154 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from sqlalchemy import and_, or_
+from app import db
+from app.models.report_job import ReportJob
+from app.services.report_generation_service import build_report
+
+logger = logging.getLogger(__name__)
+
+REPORT_JOB_WORKERS = int(os.environ.get('REPORT_JOB_WORKERS', 2))
+# A job still "running" after this long is assumed lost (e.g. its worker restarted)
+REPORT_JOB_STALE_SECONDS = int(os.environ.get('REPORT_JOB_STALE_SECONDS', 600))
+REPORT_JOB_MAX_ATTEMPTS = int(os.environ.get('REPORT_JOB_MAX_ATTEMPTS', 3))
+
+executor = ThreadPoolExecutor(max_workers=REPORT_JOB_WORKERS, thread_name_prefix='report-job')
+
+_recovered_pid = None
+_recovery_lock = threading.Lock()
+# job id -> time.monotonic() of its last requeue from a status poll
+_requeued_at = {}
+
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+
+def _as_utc(value):
+    # SQLite hands timestamps back without a timezone; they are stored as UTC
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def _stale_before():
+    return _utcnow() - timedelta(seconds=REPORT_JOB_STALE_SECONDS)
+
+
+def _is_pending(stale_before):
+    """Jobs that are waiting for a worker: queued, or running on a worker that has gone away."""
+    return or_(
+        ReportJob.status == 'queued',
+        and_(ReportJob.status == 'running', ReportJob.started_at < stale_before),
+    )
+
+
+def _enqueue(job_id):
+    executor.submit(_run_job, current_app._get_current_object(), job_id)
+
+
+def _recover_jobs():
+    """
+    Requeues jobs left behind by a previous process, once per process.
+    Several processes may requeue the same job; the claim lets only one run it.
+    """
+    global _recovered_pid
+    if _recovered_pid == os.getpid():
+        return
+    with _recovery_lock:
+        if _recovered_pid == os.getpid():
+            return
+        _recovered_pid = os.getpid()
+        job_ids = [job_id for job_id, in db.session.query(ReportJob.id).filter(_is_pending(_stale_before())).all()]
+    for job_id in job_ids:
+        _enqueue(job_id)
+    if job_ids:
+        logger.info(f"Requeued {len(job_ids)} pending report jobs")
+
+
+def _claim(job_id):
+    """Atomically moves a pending job to running; False if another worker already has it."""
+    claimed = ReportJob.query.filter(ReportJob.id == job_id, _is_pending(_stale_before())).update({
+        ReportJob.status: 'running',
+        ReportJob.started_at: _utcnow(),
+        ReportJob.attempts: ReportJob.attempts + 1,
+    }, synchronize_session=False)
+    db.session.commit()
+    return claimed == 1
+
+
+def _run_job(app, job_id):
+    with _recovery_lock:
+        _requeued_at.pop(job_id, None)
+    with app.app_context():
+        try:
+            if not _claim(job_id):
+                return
+            job = db.session.get(ReportJob, job_id)
+            try:
+                html_content, pdf_filename = build_report(job.image)
+            except Exception as e:
+                logger.error(f"Report job {job_id} attempt {job.attempts} failed: {str(e)}")
+                db.session.rollback()
+                retry = job.attempts < REPORT_JOB_MAX_ATTEMPTS
+                job.status = 'queued' if retry else 'failed'
+                job.error = str(e)
+                if not retry:
+                    job.image = None
+                    job.finished_at = _utcnow()
+                db.session.commit()
+                if retry:
+                    _enqueue(job_id)
+                return
+
+            job.status = 'succeeded'
+            job.report_html = html_content
+            job.pdf_filename = pdf_filename
+            job.error = None
+            job.image = None
+            job.finished_at = _utcnow()
+            db.session.commit()
+        except Exception as e:
+            logger.error(f"Error running report job {job_id}: {str(e)}")
+            db.session.rollback()
+
+
+def submit_report_job(image_bytes):
+    """Persists a report job for the image and queues it; returns the job."""
+    _recover_jobs()
+    job = ReportJob(id=uuid.uuid4().hex, status='queued', image=image_bytes, attempts=0)
+    db.session.add(job)
+    db.session.commit()
+    _enqueue(job.id)
+    return job
+
+
+def _requeue_stale(job_id):
+    """Requeues a job at most once per REPORT_JOB_STALE_SECONDS, however often it is polled."""
+    now = time.monotonic()
+    with _recovery_lock:
+        last = _requeued_at.get(job_id)
+        if last is not None and now - last < REPORT_JOB_STALE_SECONDS:
+            return
+        _requeued_at[job_id] = now
+    _enqueue(job_id)
+
+
+def get_report_job(job_id):
+    """
+    Returns the job, or None if there is no such job. A running job whose
+    worker has gone away is requeued. Queued jobs are already waiting in
+    the executor (or were requeued by _recover_jobs), so polling them never
+    queues them again.
+    """
+    _recover_jobs()
+    job = db.session.get(ReportJob, job_id)
+    if job is None:
+        return None
+    if job.status == 'running' and job.started_at and _as_utc(job.started_at) < _stale_before():
+        _requeue_stale(job.id)
+    return job
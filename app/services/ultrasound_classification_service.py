@@ -1,53 +1,125 @@
+import os
+from itertools import islice
 import torch
 from torchvision import transforms
-from PIL import Image
-import io
+from app.utils.batching import MicroBatcher
+from app.utils.result_cache import file_version
+from app.utils.helpers import DecodedImage
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 model_path = 'app/models/fetal_planes_model.pt'
 model = torch.jit.load(model_path, map_location=device)
 model.eval()
+CLASSIFIER_MODEL_VERSION = file_version(model_path)
 
 main_class_names = ['Fetal abdomen', 'Fetal brain', 'Fetal femur', 'Fetal thorax', 'Maternal cervix', 'Other']
 brain_class_names = ['Not A Brain', 'Other', 'Trans-cerebellum', 'Trans-thalamic', 'Trans-ventricular']
 
-def preprocess_image(image_bytes):
-    transform = transforms.Compose([
-        transforms.Grayscale(num_output_channels=1),
-        transforms.Resize((224, 224)),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.5], std=[0.5]),
-    ])
-    image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+# Concurrent /classify-ultrasound requests are coalesced into one forward pass
+CLASSIFIER_MAX_BATCH_SIZE = int(os.environ.get('CLASSIFIER_MAX_BATCH_SIZE', 16))
+CLASSIFIER_MAX_WAIT_MS = float(os.environ.get('CLASSIFIER_MAX_WAIT_MS', 5))
+# Upper bound on frames accepted by one /classify-ultrasound/batch request
+CLASSIFIER_MAX_FRAMES = int(os.environ.get('CLASSIFIER_MAX_FRAMES', 512))
+
+def run_model_batch(input_tensors):
+    """Runs a list of (1, 1, 224, 224) tensors through the model in one pass."""
+    batch = torch.cat(input_tensors, dim=0)
+    with torch.no_grad():
+        main_output, brain_output = model(batch)
+    return [(main_output[i:i + 1], brain_output[i:i + 1]) for i in range(len(input_tensors))]
+
+batcher = MicroBatcher(
+    run_model_batch,
+    max_batch_size=CLASSIFIER_MAX_BATCH_SIZE,
+    max_wait_ms=CLASSIFIER_MAX_WAIT_MS,
+    name='ultrasound-classifier'
+)
+
+transform = transforms.Compose([
+    transforms.Grayscale(num_output_channels=1),
+    transforms.Resize((224, 224)),
+    transforms.ToTensor(),
+    transforms.Normalize(mean=[0.5], std=[0.5]),
+])
+
+def preprocess_pil_image(image):
     return transform(image).unsqueeze(0).to(device)
 
+def preprocess_image(image_bytes):
+    return preprocess_pil_image(DecodedImage(image_bytes).rgb)
+
 def process_output(output, class_names):
     probabilities = torch.nn.functional.softmax(output[0], dim=0)
     results = [{"name": name, "probability": float(prob)} for name, prob in zip(class_names, probabilities)]
     results.sort(key=lambda x: x['probability'], reverse=True)
     return results
 
+def build_response(main_output, brain_output):
+    main_results = process_output(main_output, main_class_names)
+    main_class = main_results[0]['name']
+    brain_classification = None
+    # The brain head is only meaningful for brain planes, skip its softmax otherwise
+    if main_class == 'Fetal brain':
+        brain_results = process_output(brain_output, brain_class_names)
+        brain_classification = {
+            "mainClass": brain_results[0]['name'],
+            "accuracy": brain_results[0]['probability'],
+            "allClasses": brain_results
+        }
+    return {
+        "mainClassification": {
+            "mainClass": main_class,
+            "accuracy": main_results[0]['probability'],
+            "allClasses": main_results
+        },
+        "brainClassification": brain_classification
+    }
+
 def classify_image(image_bytes):
     try:
         input_tensor = preprocess_image(image_bytes)
-        with torch.no_grad():
-            main_output, brain_output = model(input_tensor)
-        main_results = process_output(main_output, main_class_names)
-        brain_results = process_output(brain_output, brain_class_names)
-        main_class = main_results[0]['name']
-        response = {
-            "mainClassification": {
-                "mainClass": main_class,
-                "accuracy": main_results[0]['probability'],
-                "allClasses": main_results
-            },
-            "brainClassification": {
-                "mainClass": brain_results[0]['name'],
-                "accuracy": brain_results[0]['probability'],
-                "allClasses": brain_results
-            } if main_class == 'Fetal brain' else None
-        }
-        return response
+        main_output, brain_output = batcher.submit(input_tensor).result()
+        return build_response(main_output, brain_output)
     except Exception as e:
         raise e
+
+def classify_pil_image(image):
+    """classify_image for an already decoded PIL image."""
+    main_output, brain_output = batcher.submit(preprocess_pil_image(image)).result()
+    return build_response(main_output, brain_output)
+
+def classify_images(frames):
+    """
+    Classifies many frames with batched forward passes.
+
+    Args:
+        frames (iterable): (filename, image_bytes) pairs. The iterable is
+            consumed one batch at a time, so a generator only ever has one
+            batch of frames in memory.
+
+    Returns:
+        list: One result per frame, in input order. Frames that cannot be
+        decoded get an "error" entry instead of classifications.
+    """
+    results = []
+    frames = iter(frames)
+    while True:
+        chunk = list(islice(frames, CLASSIFIER_MAX_BATCH_SIZE))
+        if not chunk:
+            break
+        chunk_results = [None] * len(chunk)
+        tensors = []
+        positions = []
+        for i, (filename, image_bytes) in enumerate(chunk):
+            try:
+                tensors.append(preprocess_image(image_bytes))
+                positions.append(i)
+            except Exception as e:
+                chunk_results[i] = {"filename": filename, "error": f"Unable to decode image: {str(e)}"}
+
+        if tensors:
+            for i, (main_output, brain_output) in zip(positions, run_model_batch(tensors)):
+                chunk_results[i] = {"filename": chunk[i][0], **build_response(main_output, brain_output)}
+        results.extend(chunk_results)
+    return results
@@ -0,0 +1,123 @@
+import hashlib
+import os
+import threading
+import time
+import uuid
+
+ARTIFACT_STORE_MAX_BYTES = int(os.environ.get('ARTIFACT_STORE_MAX_BYTES', 512 * 1024 * 1024))
+ARTIFACT_STORE_MAX_AGE_SECONDS = int(os.environ.get('ARTIFACT_STORE_MAX_AGE_SECONDS', 30 * 24 * 3600))
+# Age-based sweeps walk the whole directory, so they run at most this often
+ARTIFACT_STORE_SWEEP_SECONDS = int(os.environ.get('ARTIFACT_STORE_SWEEP_SECONDS', 3600))
+
+
+def content_key(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class ArtifactStore:
+    """
+    Content-addressed files in one directory, named `<key><suffix>`.
+
+    Reading an artifact refreshes its modification time, so eviction removes
+    the least recently used files first: any older than `max_age_seconds`,
+    then the oldest until the directory is back under `max_bytes`.
+    """
+
+    def __init__(self, directory, suffix, max_bytes, max_age_seconds, sweep_seconds=ARTIFACT_STORE_SWEEP_SECONDS):
+        self.directory = directory
+        self.suffix = suffix
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.sweep_seconds = sweep_seconds
+        self._lock = threading.Lock()
+        self._total_bytes = None
+        self._last_sweep = 0.0
+
+    def filename(self, key):
+        return f"{key}{self.suffix}"
+
+    def path(self, key):
+        return os.path.join(self.directory, self.filename(key))
+
+    def get(self, key):
+        """Path of the stored artifact, or None if it is not in the store."""
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def put(self, key, data):
+        """Stores `data` under `key` and returns its path."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        try:
+            replaced_bytes = os.stat(path).st_size
+        except OSError:
+            replaced_bytes = 0
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes += len(data) - replaced_bytes
+            due = (self._total_bytes is None
+                   or self._total_bytes > self.max_bytes
+                   or time.time() - self._last_sweep > self.sweep_seconds)
+        if due:
+            self.evict(keep=key)
+        return path
+
+    def get_or_create(self, key, render):
+        """Path of the artifact for `key`, calling `render()` for its bytes only when it is missing."""
+        return self.get(key) or self.put(key, render())
+
+    def _entries(self):
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return entries
+        for name in names:
+            if not name.endswith(self.suffix):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self, keep=None):
+        """
+        Removes expired artifacts, then the least recently used until under
+        budget. The artifact for `keep`, typically the one just written, is
+        never removed, even if it alone is over budget.
+        """
+        now = time.time()
+        keep_path = self.path(keep) if keep is not None else None
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        # Trim to 90% of the budget so eviction does not run on every write
+        target = int(self.max_bytes * 0.9) if total > self.max_bytes else total
+        for mtime, size, path in entries:
+            if now - mtime <= self.max_age_seconds and total <= target:
+                break
+            if path == keep_path:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        with self._lock:
+            self._total_bytes = total
+            self._last_sweep = now
@@ -0,0 +1,142 @@
+import os
+import tarfile
+import zipfile
+from functools import cached_property
+from io import BytesIO
+import cv2
+import numpy as np
+from PIL import Image
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff', '.webp', '.gif'}
+
+# zlib level 0-9 for PNG results: lower is faster to encode, higher gives smaller bodies
+PNG_COMPRESS_LEVEL = int(os.environ.get('PNG_COMPRESS_LEVEL', 6))
+
+# Uncompressed size limits for uploaded archives, checked before a member is read
+ARCHIVE_MEMBER_MAX_BYTES = int(os.environ.get('ARCHIVE_MEMBER_MAX_BYTES', 50 * 1024 * 1024))
+ARCHIVE_TOTAL_MAX_BYTES = int(os.environ.get('ARCHIVE_TOTAL_MAX_BYTES', 512 * 1024 * 1024))
+
+
+def is_image_filename(filename):
+    return os.path.splitext(filename or '')[1].lower() in IMAGE_EXTENSIONS
+
+
+def _check_member_size(name, size, total, max_member_bytes, max_total_bytes):
+    if size > max_member_bytes:
+        raise ValueError(f"Archive member {name} is larger than {max_member_bytes} bytes")
+    if total + size > max_total_bytes:
+        raise ValueError(f"Archive contents are larger than {max_total_bytes} bytes")
+    return total + size
+
+
+def iter_archive_images(file_storage, max_files=None, max_member_bytes=ARCHIVE_MEMBER_MAX_BYTES,
+                        max_total_bytes=ARCHIVE_TOTAL_MAX_BYTES):
+    """
+    Yields (filename, bytes) for every image inside an uploaded zip or tar archive.
+
+    Tar archives (optionally gzip/bz2/xz compressed) are read as a stream,
+    so members are never all held in memory at once. Each member's declared
+    uncompressed size is checked before it is read; zip and tar readers
+    never return more than the declared size.
+
+    Raises:
+        ValueError: If the archive holds more than `max_files` images, a
+        member or the images together exceed the size limits, or it is not
+        a zip or tar file.
+    """
+    stream = file_storage.stream
+    count = 0
+    total = 0
+
+    if zipfile.is_zipfile(stream):
+        stream.seek(0)
+        with zipfile.ZipFile(stream) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or not is_image_filename(info.filename):
+                    continue
+                count += 1
+                if max_files is not None and count > max_files:
+                    raise ValueError(f"Archive contains more than {max_files} images")
+                total = _check_member_size(info.filename, info.file_size, total, max_member_bytes, max_total_bytes)
+                yield info.filename, archive.read(info)
+        return
+
+    stream.seek(0)
+    try:
+        archive = tarfile.open(fileobj=stream, mode='r|*')
+    except tarfile.TarError:
+        raise ValueError("Archive must be a zip or tar file")
+    with archive:
+        for member in archive:
+            if not member.isfile() or not is_image_filename(member.name):
+                continue
+            count += 1
+            if max_files is not None and count > max_files:
+                raise ValueError(f"Archive contains more than {max_files} images")
+            total = _check_member_size(member.name, member.size, total, max_member_bytes, max_total_bytes)
+            yield member.name, archive.extractfile(member).read()
+
+
+def _decode_with_pil(image_bytes):
+    """First frame of the image as an OpenCV-style (grayscale or BGR) array."""
+    try:
+        with Image.open(BytesIO(image_bytes)) as image:
+            if image.mode == 'L':
+                return np.array(image)
+            return cv2.cvtColor(np.array(image.convert('RGB')), cv2.COLOR_RGB2BGR)
+    except Exception:
+        raise ValueError("Image decoding failed")
+
+
+class DecodedImage:
+    """
+    An uploaded image decoded once, exposing the RGB and grayscale views the
+    analysis services consume. Every image endpoint decodes through this
+    class, so the same upload yields the same pixels whichever endpoint
+    analyses it.
+    """
+
+    def __init__(self, image_bytes):
+        image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_UNCHANGED)
+        if image is None:
+            # OpenCV cannot read some formats PIL can, e.g. GIF
+            image = _decode_with_pil(image_bytes)
+        if image.dtype == np.uint16:
+            image = (image >> 8).astype(np.uint8)
+        self.array = image
+
+    @cached_property
+    def gray_array(self):
+        if self.array.ndim == 2:
+            return self.array
+        if self.array.shape[2] == 4:
+            return cv2.cvtColor(self.array, cv2.COLOR_BGRA2GRAY)
+        return cv2.cvtColor(self.array, cv2.COLOR_BGR2GRAY)
+
+    @cached_property
+    def rgb_array(self):
+        if self.array.ndim == 2:
+            return cv2.cvtColor(self.array, cv2.COLOR_GRAY2RGB)
+        if self.array.shape[2] == 4:
+            return cv2.cvtColor(self.array, cv2.COLOR_BGRA2RGB)
+        return cv2.cvtColor(self.array, cv2.COLOR_BGR2RGB)
+
+    @property
+    def rgb(self):
+        """A new RGB PIL image built from rgb_array."""
+        return Image.fromarray(self.rgb_array)
+
+
+def encode_image(image, image_format='PNG'):
+    """
+    Encodes a PIL image or uint8 array as PNG or WEBP bytes. WEBP is
+    lossless so scans keep every pixel value.
+    """
+    if isinstance(image, np.ndarray):
+        image = Image.fromarray(image)
+    buffer = BytesIO()
+    if image_format == 'WEBP':
+        image.save(buffer, format='WEBP', lossless=True)
+    else:
+        image.save(buffer, format='PNG', compress_level=PNG_COMPRESS_LEVEL)
+    return buffer.getvalue()
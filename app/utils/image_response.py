@@ -0,0 +1,80 @@
+import json
+import uuid
+import base64
+from io import BytesIO
+from flask import Response, jsonify, request, send_file
+
+JSON_MIMETYPE = 'application/json'
+MULTIPART_MIMETYPE = 'multipart/mixed'
+# Response mimetype -> encoder format
+IMAGE_MIMETYPES = {'image/png': 'PNG', 'image/webp': 'WEBP'}
+# ?format= shortcuts for clients that cannot set an Accept header
+FORMAT_ALIASES = {
+    'json': JSON_MIMETYPE,
+    'png': 'image/png',
+    'webp': 'image/webp',
+    'multipart': MULTIPART_MIMETYPE,
+}
+
+
+def negotiate_image_response():
+    """
+    Picks how an image-producing endpoint answers: base64-in-JSON (the
+    default, also for */*), a raw PNG/WEBP body, or multipart JSON + binary.
+
+    Returns:
+        tuple: (response mimetype, image encoder format)
+    """
+    requested = request.args.get('format')
+    if requested:
+        mimetype = FORMAT_ALIASES.get(requested.lower())
+        if mimetype is None:
+            raise ValueError(f"Unsupported format: {requested}")
+    else:
+        mimetype = request.accept_mimetypes.best_match(
+            [JSON_MIMETYPE, 'image/png', 'image/webp', MULTIPART_MIMETYPE], default=JSON_MIMETYPE
+        )
+    return mimetype, IMAGE_MIMETYPES.get(mimetype, 'PNG')
+
+
+def _image_mimetype(image_format):
+    return 'image/webp' if image_format == 'WEBP' else 'image/png'
+
+
+def image_response(mimetype, image_bytes, image_format, image_key, metadata=None):
+    """
+    Builds the negotiated response for an endpoint producing one image.
+
+    Raw image responses carry `metadata` as JSON in the X-Result-Metadata
+    header; multipart responses send it as the first part. Binary bodies
+    are streamed from the encoder's buffer without base64.
+    """
+    metadata = metadata or {}
+
+    if mimetype == JSON_MIMETYPE:
+        payload = dict(metadata)
+        payload[image_key] = base64.b64encode(image_bytes).decode('utf-8')
+        return jsonify(payload)
+
+    if mimetype in IMAGE_MIMETYPES:
+        response = send_file(BytesIO(image_bytes), mimetype=_image_mimetype(image_format))
+        if metadata:
+            response.headers['X-Result-Metadata'] = json.dumps(metadata, separators=(',', ':'))
+        return response
+
+    boundary = uuid.uuid4().hex
+
+    def generate():
+        yield (f"--{boundary}\r\nContent-Type: {JSON_MIMETYPE}\r\n\r\n").encode('utf-8')
+        yield json.dumps(metadata).encode('utf-8')
+        yield (f"\r\n--{boundary}\r\nContent-Type: {_image_mimetype(image_format)}\r\n"
+               f"Content-Disposition: inline; name=\"{image_key}\"\r\n\r\n").encode('utf-8')
+        yield image_bytes
+        yield f"\r\n--{boundary}--\r\n".encode('utf-8')
+
+    return Response(generate(), mimetype=f'{MULTIPART_MIMETYPE}; boundary={boundary}')
+
+
+def format_namespace(namespace, image_format):
+    """Result-cache namespace for an endpoint's output in a given image format."""
+    return namespace if image_format == 'PNG' else f"{namespace}:{image_format.lower()}"
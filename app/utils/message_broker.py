@@ -0,0 +1,58 @@
+import threading
+from abc import ABC, abstractmethod
+
+
+class MessageBroker(ABC):
+    """
+    Wakes requests waiting for new messages on a channel.
+
+    A channel's version is the id of the newest message published to it, so
+    a waiter that asks for anything newer than the id it has already seen
+    cannot miss a publish that happens between its read and its wait.
+    """
+
+    @abstractmethod
+    def publish(self, channel, message_id):
+        """Records `message_id` as the channel's newest message and wakes its waiters."""
+
+    @abstractmethod
+    def wait(self, channel, after_id, timeout):
+        """
+        Blocks until `channel` has a version above `after_id` or `timeout`
+        seconds pass, and returns the channel's current version.
+        """
+
+
+class InProcessBroker(MessageBroker):
+    """
+    Broker for a single worker process. Waiters in other processes are not
+    woken; they see the message on their next periodic check instead.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._versions = {}
+
+    def publish(self, channel, message_id):
+        with self._condition:
+            if message_id > self._versions.get(channel, 0):
+                self._versions[channel] = message_id
+            self._condition.notify_all()
+
+    def wait(self, channel, after_id, timeout):
+        with self._condition:
+            self._condition.wait_for(lambda: self._versions.get(channel, 0) > after_id, timeout)
+            return self._versions.get(channel, 0)
+
+
+_broker = InProcessBroker()
+
+
+def get_broker():
+    return _broker
+
+
+def set_broker(broker):
+    """Replaces the broker, e.g. with one backed by a shared message bus."""
+    global _broker
+    _broker = broker
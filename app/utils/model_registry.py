@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+import onnxruntime as ort
+
+# Models are loaded once per worker process and shared by every request
+# handled by that process.
+_models = {}
+_model_stats = {}
+_registry_lock = threading.Lock()
+_load_locks = {}
+
+# ONNX Runtime session tuning; 0 lets onnxruntime pick the thread counts
+ONNX_INTRA_OP_THREADS = int(os.environ.get('ONNX_INTRA_OP_THREADS', 0))
+ONNX_INTER_OP_THREADS = int(os.environ.get('ONNX_INTER_OP_THREADS', 0))
+ONNX_GRAPH_OPTIMIZATION_LEVEL = os.environ.get('ONNX_GRAPH_OPTIMIZATION_LEVEL', 'all')
+ONNX_ENABLE_MEM_ARENA = os.environ.get('ONNX_ENABLE_MEM_ARENA', 'true').lower() in ('1', 'true', 'yes')
+ONNX_ENABLE_MEM_PATTERN = os.environ.get('ONNX_ENABLE_MEM_PATTERN', 'true').lower() in ('1', 'true', 'yes')
+
+_GRAPH_OPTIMIZATION_LEVELS = {
+    'disable': ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    'basic': ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    'extended': ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    'all': ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+
+def _current_rss_bytes():
+    """Resident set size of this process, or None when it cannot be read."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _parameter_bytes(model):
+    """Size of a torch model's parameters and buffers, or None for other objects."""
+    if not hasattr(model, 'parameters') or not hasattr(model, 'buffers'):
+        return None
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+def get_model(name, loader):
+    """
+    Returns the model registered under `name`, calling `loader()` to build it
+    the first time it is requested in this process.
+
+    Concurrent first requests for the same model wait for a single load
+    instead of each reading the weights from disk.
+    """
+    model = _models.get(name)
+    if model is not None:
+        return model
+
+    with _registry_lock:
+        load_lock = _load_locks.setdefault(name, threading.Lock())
+
+    with load_lock:
+        model = _models.get(name)
+        if model is not None:
+            return model
+
+        rss_before = _current_rss_bytes()
+        start = time.perf_counter()
+        model = loader()
+        load_seconds = time.perf_counter() - start
+        rss_after = _current_rss_bytes()
+
+        _model_stats[name] = {
+            "load_seconds": round(load_seconds, 4),
+            "loaded_at": time.time(),
+            "parameter_bytes": _parameter_bytes(model),
+            "rss_delta_bytes": rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+        }
+        _models[name] = model
+        print(f"Model '{name}' loaded in {load_seconds:.2f}s")
+        return model
+
+
+def create_onnx_session(model_path):
+    """Builds an ONNX Runtime CPU session using the ONNX_* tuning settings."""
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"The model file {model_path} does not exist.")
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = ONNX_INTRA_OP_THREADS
+    options.inter_op_num_threads = ONNX_INTER_OP_THREADS
+    options.graph_optimization_level = _GRAPH_OPTIMIZATION_LEVELS.get(
+        ONNX_GRAPH_OPTIMIZATION_LEVEL.lower(), ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    )
+    options.enable_cpu_mem_arena = ONNX_ENABLE_MEM_ARENA
+    options.enable_mem_pattern = ONNX_ENABLE_MEM_PATTERN
+    return ort.InferenceSession(model_path, sess_options=options, providers=['CPUExecutionProvider'])
+
+
+def model_stats():
+    """Load time and memory usage of every model loaded in this process."""
+    return {
+        "pid": os.getpid(),
+        "rss_bytes": _current_rss_bytes(),
+        "models": {name: dict(stats) for name, stats in _model_stats.items()},
+    }
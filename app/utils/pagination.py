@@ -0,0 +1,41 @@
+import base64
+import json
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(row_id):
+    """Opaque cursor for keyset pagination on a monotonically increasing id."""
+    payload = json.dumps(int(row_id))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Returns the id a cursor was made from.
+
+    Raises:
+        ValueError: If the cursor was not produced by encode_cursor.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        # Cursors issued before paging moved to ids alone were [timestamp, id]
+        if isinstance(row_id, list) and len(row_id) == 2:
+            row_id = row_id[1]
+        if isinstance(row_id, bool) or not isinstance(row_id, int):
+            raise ValueError(f"Unexpected cursor payload {row_id!r}")
+        return row_id
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def parse_limit(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Page size from a query argument, clamped to [1, maximum]."""
+    if value is None or value == '':
+        return default
+    try:
+        return min(max(int(value), 1), maximum)
+    except ValueError as e:
+        raise ValueError("limit must be an integer") from e
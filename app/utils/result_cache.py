@@ -0,0 +1,217 @@
+import hashlib
+import os
+import pickle
+import threading
+import uuid
+from cachetools import LRUCache
+
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+# The on-disk tier is shared by all workers and only enabled when a directory is set
+RESULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR')
+RESULT_CACHE_DISK_MAX_BYTES = int(os.environ.get('RESULT_CACHE_DISK_MAX_BYTES', 1024 * 1024 * 1024))
+
+_MISSING = object()
+
+
+def image_digest(image_bytes):
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def make_key(namespace, version, digest):
+    return hashlib.sha256(f"{namespace}:{version}:{digest}".encode('utf-8')).hexdigest()
+
+
+def file_version(*paths):
+    """
+    Cheap version tag for model files based on their size and modification
+    time, so replacing a model invalidates results computed with the old one.
+    """
+    parts = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            parts.append(f"{os.path.basename(path)}:{stat.st_size}:{int(stat.st_mtime)}")
+        except OSError:
+            parts.append(f"{os.path.basename(path)}:missing")
+    return '|'.join(parts)
+
+
+class _MemoryTier(LRUCache):
+    def __init__(self, maxsize, on_evict):
+        super().__init__(maxsize=maxsize, getsizeof=len)
+        self._on_evict = on_evict
+
+    def popitem(self):
+        item = super().popitem()
+        self._on_evict()
+        return item
+
+
+class ResultCache:
+    """
+    Two-tier cache for inference results keyed by content hash.
+
+    Values are pickled, which both bounds the memory tier by size in bytes
+    and hands every caller its own copy. The memory tier is an LRU per
+    process; the optional disk tier evicts least recently used files once
+    it grows past `disk_max_bytes`.
+    """
+
+    def __init__(self, max_bytes, disk_dir=None, disk_max_bytes=None):
+        self._lock = threading.Lock()
+        self._memory = _MemoryTier(max_bytes, self._count_memory_eviction)
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._disk_bytes = None
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+        }
+
+    def _count_memory_eviction(self):
+        self._stats["memory_evictions"] += 1
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.pkl")
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except OSError:
+            return None
+
+    def _write_disk(self, key, data):
+        if not self.disk_dir or len(data) > self.disk_max_bytes:
+            return
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan_disk_bytes()
+            else:
+                self._disk_bytes += len(data)
+            over_budget = self._disk_bytes > self.disk_max_bytes
+        if over_budget:
+            self._evict_disk()
+
+    def _list_disk_entries(self):
+        entries = []
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                if not name.endswith('.pkl'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _scan_disk_bytes(self):
+        return sum(size for _, size, _ in self._list_disk_entries())
+
+    def _evict_disk(self):
+        # Trim to 90% of the budget so eviction does not run on every write
+        target = int(self.disk_max_bytes * 0.9)
+        entries = sorted(self._list_disk_entries())
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        with self._lock:
+            self._disk_bytes = total
+            self._stats["disk_evictions"] += evicted
+
+    def get(self, key, default=None):
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._stats["memory_hits"] += 1
+                return pickle.loads(data)
+
+        data = self._read_disk(key)
+        if data is not None:
+            with self._lock:
+                self._stats["disk_hits"] += 1
+                if len(data) <= self._memory.maxsize:
+                    self._memory[key] = data
+            return pickle.loads(data)
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return default
+
+    def set(self, key, value):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            if len(data) <= self._memory.maxsize:
+                self._memory[key] = data
+        self._write_disk(key, data)
+
+    def get_or_compute(self, key, compute):
+        """Returns the cached value for `key`, or computes, stores and returns it."""
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        value = compute()
+        self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory.currsize,
+                "memory_max_bytes": self._memory.maxsize,
+                "disk_enabled": bool(self.disk_dir),
+                "disk_bytes": self._disk_bytes,
+                "disk_max_bytes": self.disk_max_bytes if self.disk_dir else None,
+            })
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else None
+        return stats
+
+
+result_cache = ResultCache(RESULT_CACHE_MAX_BYTES, RESULT_CACHE_DIR, RESULT_CACHE_DISK_MAX_BYTES)
+
+
+def cached_result(namespace, version, image_bytes, compute):
+    """
+    Returns the result of `compute()` for these image bytes, reusing a
+    previous result computed by the same model version when there is one.
+    Exceptions raised by `compute()` are not cached.
+    """
+    return cached_result_for_digest(namespace, version, image_digest(image_bytes), compute)
+
+
+def cached_result_for_digest(namespace, version, digest, compute):
+    """cached_result for callers that already hold the image digest."""
+    key = make_key(namespace, version, digest)
+    return result_cache.get_or_compute(key, compute)
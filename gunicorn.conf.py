@@ -0,0 +1,13 @@
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+
+# Threaded workers: long polls and chat event streams sit idle on a thread
+# for up to 25 s, so a sync worker would stop serving every other route
+# while one is open. Threads also let the classifier's micro-batcher see
+# concurrent requests. Models are loaded once per worker process and shared
+# by its threads, so scale with threads before adding workers.
+worker_class = 'gthread'
+workers = int(os.environ.get('GUNICORN_WORKERS', 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
@@ -0,0 +1,28 @@
+"""Index chat messages by user and id for keyset paging.
+
+Revision ID: 3b9d7e2c4f61
+Revises: f4a8c2b7e915
+Create Date: 2026-10-18 16:42:10.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b9d7e2c4f61'
+down_revision = 'f4a8c2b7e915'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('chat_message', schema=None) as batch_op:
+        batch_op.drop_index('ix_chat_message_user_id_timestamp')
+        batch_op.create_index('ix_chat_message_user_id_id', ['user_id', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('chat_message', schema=None) as batch_op:
+        batch_op.drop_index('ix_chat_message_user_id_id')
+        batch_op.create_index('ix_chat_message_user_id_timestamp', ['user_id', 'timestamp'], unique=False)
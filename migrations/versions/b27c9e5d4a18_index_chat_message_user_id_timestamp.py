@@ -0,0 +1,26 @@
+"""Index chat messages by user and timestamp.
+
+Revision ID: b27c9e5d4a18
+Revises: 8d1e4f2a6b93
+Create Date: 2026-10-18 11:03:52.907114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b27c9e5d4a18'
+down_revision = '8d1e4f2a6b93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('chat_message', schema=None) as batch_op:
+        batch_op.create_index('ix_chat_message_user_id_timestamp', ['user_id', 'timestamp'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('chat_message', schema=None) as batch_op:
+        batch_op.drop_index('ix_chat_message_user_id_timestamp')
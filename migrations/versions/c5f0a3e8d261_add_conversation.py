@@ -0,0 +1,75 @@
+"""Add conversation summary table and backfill it.
+
+Revision ID: c5f0a3e8d261
+Revises: b27c9e5d4a18
+Create Date: 2026-10-18 11:48:07.250361
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5f0a3e8d261'
+down_revision = 'b27c9e5d4a18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conversation = op.create_table('conversation',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('gynecologist_id', sa.Integer(), nullable=False),
+    sa.Column('patient_id', sa.Integer(), nullable=False),
+    sa.Column('last_message_id', sa.Integer(), nullable=False),
+    sa.Column('last_message_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('unread_by_gynecologist', sa.Integer(), nullable=False),
+    sa.Column('unread_by_patient', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['gynecologist_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['last_message_id'], ['gynecologist_message.id'], ),
+    sa.ForeignKeyConstraint(['patient_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('gynecologist_id', 'patient_id', name='uq_conversation_gynecologist_id_patient_id')
+    )
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.create_index('ix_conversation_gynecologist_id_last_message_at', ['gynecologist_id', 'last_message_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_conversation_patient_id'), ['patient_id'], unique=False)
+
+    # Backfill one row per existing gynecologist/patient pair
+    message = sa.table('gynecologist_message',
+        sa.column('id', sa.Integer()),
+        sa.column('gynecologist_id', sa.Integer()),
+        sa.column('patient_id', sa.Integer()),
+        sa.column('is_from_patient', sa.Boolean()),
+        sa.column('timestamp', sa.DateTime()),
+        sa.column('read', sa.Boolean()),
+    )
+    unread = sa.func.coalesce(message.c.read, sa.false()) == sa.false()
+    from_patient = sa.func.coalesce(message.c.is_from_patient, sa.false()) == sa.true()
+    totals = sa.select(
+        message.c.gynecologist_id,
+        message.c.patient_id,
+        sa.func.max(message.c.id).label('last_message_id'),
+        sa.func.sum(sa.case((sa.and_(from_patient, unread), 1), else_=0)).label('unread_by_gynecologist'),
+        sa.func.sum(sa.case((sa.and_(sa.not_(from_patient), unread), 1), else_=0)).label('unread_by_patient'),
+    ).group_by(message.c.gynecologist_id, message.c.patient_id).subquery()
+    last = message.alias('last_message')
+    op.execute(conversation.insert().from_select(
+        ['gynecologist_id', 'patient_id', 'last_message_id', 'last_message_at', 'unread_by_gynecologist', 'unread_by_patient'],
+        sa.select(
+            totals.c.gynecologist_id,
+            totals.c.patient_id,
+            totals.c.last_message_id,
+            sa.func.coalesce(last.c.timestamp, sa.func.current_timestamp()),
+            totals.c.unread_by_gynecologist,
+            totals.c.unread_by_patient,
+        ).select_from(totals.join(last, last.c.id == totals.c.last_message_id))
+    ))
+
+
+def downgrade():
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_conversation_patient_id'))
+        batch_op.drop_index('ix_conversation_gynecologist_id_last_message_at')
+
+    op.drop_table('conversation')
@@ -0,0 +1,26 @@
+"""Index gynecologist messages by conversation and read state.
+
+Revision ID: e93b6d1f0c47
+Revises: c5f0a3e8d261
+Create Date: 2026-10-18 12:31:44.602918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e93b6d1f0c47'
+down_revision = 'c5f0a3e8d261'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('gynecologist_message', schema=None) as batch_op:
+        batch_op.create_index('ix_gynecologist_message_gynecologist_id_patient_id_read', ['gynecologist_id', 'patient_id', 'read'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('gynecologist_message', schema=None) as batch_op:
+        batch_op.drop_index('ix_gynecologist_message_gynecologist_id_patient_id_read')
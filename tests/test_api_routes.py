@@ -2,7 +2,12 @@ import os
 import pytest
 from flask import Flask
 from app import create_app, db
+from app.config import Config
+from datetime import datetime, timedelta
 from io import BytesIO
+import base64
+import json
+from PIL import Image
 
 # Assuming that the test image is placed in the specified directory
 TEST_IMAGE_PATH = 'tests/images/Patient00001_Plane1_1_of_15.png'
@@ -20,6 +25,24 @@ def test_client():
 
     ctx.pop()
 
+@pytest.fixture
+def db_client(tmp_path):
+    """A client for an app backed by a fresh SQLite database with every table created."""
+    class TestConfig(Config):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'test.db'}"
+
+    flask_app = create_app(TestConfig)
+    ctx = flask_app.app_context()
+    ctx.push()
+    db.create_all()
+
+    yield flask_app.test_client()
+
+    db.session.remove()
+    db.drop_all()
+    ctx.pop()
+
 def test_chatbot(test_client):
     response = test_client.post('/api/chatbot', json={"message": "Hello!"})
     assert response.status_code == 200
@@ -40,6 +63,7 @@ def test_detect_image(test_client):
         response = test_client.post('/api/detect-image', data={'image': img_file})
     assert response.status_code == 200
     assert "detectedImage" in response.json
+    assert isinstance(response.json["detections"], list)
 
 def test_health_tracking(test_client):
     sample_data = {
@@ -54,6 +78,18 @@ def test_health_tracking(test_client):
     assert response.status_code == 200
     assert "risk_level" in response.json
 
+def test_health_tracking_batch(test_client):
+    records = [
+        {"age": 45, "systolic_bp": 120, "diastolic_bp": 80, "bs": 5.5, "bt": 37.0, "heart_rate": 72},
+        {"age": 35, "systolic_bp": 140, "diastolic_bp": 90, "bs": 13.0, "bt": 98.0, "heart_rate": 70},
+    ]
+    response = test_client.post('/api/health-tracking/batch', json={"records": records})
+    assert response.status_code == 200
+    results = response.json["results"]
+    assert len(results) == 2
+    for result in results:
+        assert result["confidence"] == result["probabilities"][result["risk_level"]]
+
 def test_calculate_circumference(test_client):
     with open(TEST_IMAGE_PATH, 'rb') as img_file:
         response = test_client.post('/api/calculate-circumference', data={'image': img_file})
@@ -96,3 +132,761 @@ def test_generate_story(test_client):
     assert "story" in response.json
     assert "images" in response.json
     assert "pdf_url" in response.json
+
+def test_models_status(test_client):
+    with open(TEST_IMAGE_PATH, 'rb') as img_file:
+        test_client.post('/api/calculate-circumference', data={'image': img_file})
+    response = test_client.get('/api/models/status')
+    assert response.status_code == 200
+    assert "head_circumference" in response.json["models"]
+    assert "load_seconds" in response.json["models"]["head_circumference"]
+
+def test_classify_ultrasound_batch(test_client):
+    with open(TEST_IMAGE_PATH, 'rb') as img_file:
+        image_bytes = img_file.read()
+    frames = [(BytesIO(image_bytes), 'frame_1.png'), (BytesIO(image_bytes), 'frame_2.png')]
+    response = test_client.post('/api/classify-ultrasound/batch', data={'images': frames})
+    assert response.status_code == 200
+    data = response.json
+    assert data['count'] == 2
+    assert all('mainClassification' in result for result in data['results'])
+    assert all('brainClassification' in result for result in data['results'])
+
+def test_calculate_fetal_age(test_client):
+    response = test_client.post('/api/calculate-fetal-age', json={"circumference": 10.495})
+    assert response.status_code == 200
+    assert response.json["fetal_age"] == "14 Weeks"
+
+def test_calculate_fetal_age_series(test_client):
+    response = test_client.post('/api/calculate-fetal-age', json={"circumference": [7.5, 8.0, 23.0, 40.0]})
+    assert response.status_code == 200
+    assert response.json["fetal_age"] == ['Fetus is less than 8 Menstrual Weeks', '13 Weeks', '25 Weeks', 'Abnormal']
+
+def test_result_cache_reuses_results(test_client):
+    with open(TEST_IMAGE_PATH, 'rb') as img_file:
+        image_bytes = img_file.read()
+    first = test_client.post('/api/classify-ultrasound', data={'image': (BytesIO(image_bytes), 'scan.png')})
+    hits_before = test_client.get('/api/cache/stats').json['memory_hits']
+    second = test_client.post('/api/classify-ultrasound', data={'image': (BytesIO(image_bytes), 'scan.png')})
+    assert second.status_code == 200
+    assert second.json == first.json
+    assert test_client.get('/api/cache/stats').json['memory_hits'] == hits_before + 1
+
+def test_full_scan(test_client):
+    with open(TEST_IMAGE_PATH, 'rb') as img_file:
+        response = test_client.post('/api/full-scan', data={'image': img_file})
+    assert response.status_code == 200
+    data = response.json
+    assert 'mainClassification' in data['classification']
+    assert 'circumference' in data['circumference']
+    assert 'detections' in data['detection']
+    assert 'enhancedImage' in data['enhancement']
+    assert 'errors' in data
+
+def test_enhance_image_tiled(test_client):
+    with open(TEST_IMAGE_PATH, 'rb') as img_file:
+        response = test_client.post('/api/enhance-image?mode=tiled', data={'image': img_file})
+    assert response.status_code == 200
+    enhanced = Image.open(BytesIO(base64.b64decode(response.json["enhancedImage"])))
+    with Image.open(TEST_IMAGE_PATH) as original:
+        assert enhanced.size == original.size
+
+def test_detect_image_binary_response(test_client):
+    with open(TEST_IMAGE_PATH, 'rb') as img_file:
+        response = test_client.post('/api/detect-image', data={'image': img_file},
+                                    headers={'Accept': 'image/webp'})
+    assert response.status_code == 200
+    assert response.mimetype == 'image/webp'
+    assert isinstance(json.loads(response.headers['X-Result-Metadata'])['detections'], list)
+    assert Image.open(BytesIO(response.data)).format == 'WEBP'
+
+def test_calculate_circumference_multipart_response(test_client):
+    with open(TEST_IMAGE_PATH, 'rb') as img_file:
+        response = test_client.post('/api/calculate-circumference', data={'image': img_file},
+                                    headers={'Accept': 'multipart/mixed'})
+    assert response.status_code == 200
+    assert response.mimetype == 'multipart/mixed'
+    assert b'"circumference"' in response.data
+    assert b'Content-Type: image/png' in response.data
+
+def test_detect_image_without_rendering(test_client):
+    with open(TEST_IMAGE_PATH, 'rb') as img_file:
+        response = test_client.post('/api/detect-image?render=false', data={'image': img_file})
+    assert response.status_code == 200
+    assert "detectedImage" not in response.json
+    for detection in response.json["detections"]:
+        assert set(detection) == {"class", "class_id", "score", "box"}
+
+def test_process_text(test_client):
+    transcription = "Doctor's appointment on 12/03/2025 at 3:30 PM and take my medicine every 8 hours"
+    response = test_client.post('/api/process_text', json={"transcription": transcription})
+    assert response.status_code == 200
+    events = response.json["events"]
+    assert [event["description"] for event in events] == ["Doctor's appointment", "Take my medicine"]
+    assert events[0]["time"] == "3:30 PM"
+    assert events[1]["recurrence"] == "every 8 hours"
+    assert response.json["times"] == ["3:30 PM"]
+
+def test_process_text_bulk(test_client):
+    body = '\n'.join([
+        json.dumps({"id": "a", "transcription": "Meeting at 14:30"}),
+        '',
+        'not json',
+        json.dumps({"id": "b", "transcription": "Yoga class everyday at 7 am"}),
+    ])
+    response = test_client.post('/api/process_text/bulk', data=body, content_type='application/x-ndjson')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.data.decode('utf-8').splitlines()]
+    assert [line.get("id") for line in lines] == ["a", None, "b"]
+    assert lines[0]["events"][0]["time"] == "02:30 PM"
+    assert "error" in lines[1]
+    assert lines[2]["events"][0]["recurrence"] == "daily"
+
+def test_poll_chat_messages_requires_ids(test_client):
+    response = test_client.get('/api/gynecologist/chat/poll', query_string={'patient_id': 1})
+    assert response.status_code == 400
+
+def test_generate_report_pdf_response(test_client):
+    with open(TEST_IMAGE_PATH, 'rb') as img_file:
+        response = test_client.post('/api/generate-report', data={'image': img_file},
+                                    headers={'Accept': 'application/pdf'})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/pdf'
+    assert response.data.startswith(b'%PDF-')
+
+def test_classify_ultrasound_batch_archive(test_client):
+    import zipfile
+    with open(TEST_IMAGE_PATH, 'rb') as img_file:
+        image_bytes = img_file.read()
+    archive = BytesIO()
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('frames/frame_1.png', image_bytes)
+        zf.writestr('frames/notes.txt', 'ignored')
+        zf.writestr('frames/frame_2.png', image_bytes)
+    archive.seek(0)
+    response = test_client.post('/api/classify-ultrasound/batch',
+                                data={'images': (BytesIO(image_bytes), 'frame_0.png'), 'archive': (archive, 'frames.zip')})
+    assert response.status_code == 200
+    assert [result['filename'] for result in response.json['results']] == ['frame_0.png', 'frames/frame_1.png', 'frames/frame_2.png']
+
+def test_classify_ultrasound_batch_rejects_oversized_archive_member(test_client):
+    import zipfile
+    from app.utils.helpers import ARCHIVE_MEMBER_MAX_BYTES
+    archive = BytesIO()
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('bomb.png', bytes(ARCHIVE_MEMBER_MAX_BYTES + 1))
+    archive.seek(0)
+    response = test_client.post('/api/classify-ultrasound/batch', data={'archive': (archive, 'bomb.zip')})
+    assert response.status_code == 400
+    assert 'larger than' in response.json['message']
+
+def test_export_inference_graph_torchscript(tmp_path):
+    import torch
+    from app.models.modelCSM import CSM, optimize_for_inference, export_inference_graph
+    model = optimize_for_inference(CSM(output_stage=1))
+    path = export_inference_graph(model, str(tmp_path / 'csm.pt'))
+    exported = torch.jit.load(path)
+    example = torch.rand(2, 1, 128, 192)
+    with torch.no_grad():
+        expected, actual = model(example), exported(example)
+    for expected_stage, actual_stage in zip(expected, actual):
+        assert torch.allclose(expected_stage, actual_stage, atol=1e-5)
+
+def test_export_inference_graph_onnx(tmp_path):
+    pytest.importorskip('onnx')
+    pytest.importorskip('onnxscript')
+    import numpy as np
+    import onnxruntime
+    import torch
+    from app.models.modelCSM import CSM, optimize_for_inference, export_inference_graph
+    model = optimize_for_inference(CSM(output_stage=1))
+    path = export_inference_graph(model, str(tmp_path / 'csm.onnx'), format='onnx')
+    example = torch.rand(2, 1, 128, 192)
+    with torch.no_grad():
+        expected = model(example)
+    actual = onnxruntime.InferenceSession(path).run(None, {'image': example.numpy()})
+    for expected_stage, actual_stage in zip(expected, actual):
+        assert np.allclose(expected_stage.numpy(), actual_stage, atol=1e-4)
+
+def test_process_text_bulk_survives_bad_lines(test_client):
+    body = '\n'.join([
+        json.dumps({"id": "number", "transcription": 123}),
+        json.dumps(["not", "an", "object"]),
+        json.dumps({"id": "en", "transcription": "Meeting on 03/04/2025 at 10:00"}),
+        json.dumps({"id": "fr", "transcription": "Meeting on 03/04/2025 at 10:00", "language": "french"}),
+    ])
+    response = test_client.post('/api/process_text/bulk', data=body, content_type='application/x-ndjson')
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.data.decode('utf-8').splitlines()]
+    assert [line["line"] for line in lines] == [1, 2, 3, 4]
+    assert "error" in lines[0] and lines[0]["id"] == "number"
+    assert "error" in lines[1]
+    assert lines[2]["dates"] == ["04/03/2025"]
+    assert lines[3]["dates"] == ["03/04/2025"]
+
+def _add_chat_messages(user_id, timestamps):
+    from app.models.chat_message import ChatMessage
+    messages = [ChatMessage(user_id=user_id, content=f"message {i}", is_bot=i % 2 == 1, timestamp=timestamp)
+                for i, timestamp in enumerate(timestamps)]
+    db.session.add_all(messages)
+    db.session.commit()
+    return [message.id for message in messages]
+
+def _walk_chat_history(client, user_id, limit):
+    pages, cursor = [], None
+    while True:
+        query = {'user_id': user_id, 'limit': limit}
+        if cursor:
+            query['cursor'] = cursor
+        response = client.get('/api/chatbot/history', query_string=query)
+        assert response.status_code == 200
+        pages.append([message['id'] for message in response.json['history']])
+        cursor = response.json['next_cursor']
+        if cursor is None:
+            return pages
+
+def test_chat_history_pages_with_cursor(db_client):
+    start = datetime(2025, 1, 1, 12, 0)
+    ids = _add_chat_messages(1, [start + timedelta(minutes=i) for i in range(5)])
+    _add_chat_messages(2, [start])
+    assert _walk_chat_history(db_client, 1, 2) == [ids[3:5], ids[1:3], ids[0:1]]
+
+def test_chat_history_pages_through_timestamp_ties(db_client):
+    timestamp = datetime(2025, 1, 1, 12, 0)
+    ids = _add_chat_messages(1, [timestamp] * 5)
+    pages = _walk_chat_history(db_client, 1, 2)
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert sorted(id for page in pages for id in page) == ids
+
+def test_chat_history_rejects_malformed_cursor(db_client):
+    response = db_client.get('/api/chatbot/history', query_string={'user_id': 1, 'cursor': 'not-a-cursor'})
+    assert response.status_code == 400
+    assert 'error' in response.json
+
+def _add_gynecologist_and_patients(patient_count):
+    from datetime import date
+    from app.models.user import User
+    from app.models.pregnancy_info import PregnancyInfo
+    gynecologist = User(full_name='Dr. Gyn', email='gyn@example.com', type='gynecologist')
+    patients = [User(full_name=f'Patient {i}', email=f'patient{i}@example.com', type='patient')
+                for i in range(patient_count)]
+    db.session.add_all([gynecologist] + patients)
+    db.session.flush()
+    db.session.add_all([PregnancyInfo(user_id=patient.id, gynecologist_id=gynecologist.id,
+                                      pregnancy_start_date=date.today() - timedelta(weeks=10))
+                        for patient in patients])
+    db.session.commit()
+    return gynecologist.id, [patient.id for patient in patients]
+
+def _send_gynecologist_message(client, patient_id, gynecologist_id, content, is_from_patient):
+    response = client.post('/api/gynecologist/chat', json={
+        "patient_id": patient_id, "gynecologist_id": gynecologist_id,
+        "message": content, "is_from_patient": is_from_patient,
+    })
+    assert response.status_code == 200
+    return response.json["id"]
+
+def test_conversation_tracks_sent_messages(db_client):
+    from app.models.conversation import Conversation
+    gynecologist_id, (patient_id,) = _add_gynecologist_and_patients(1)
+    _send_gynecologist_message(db_client, patient_id, gynecologist_id, "Hello doctor", True)
+    _send_gynecologist_message(db_client, patient_id, gynecologist_id, "Any pain?", True)
+    last_id = _send_gynecologist_message(db_client, patient_id, gynecologist_id, "Let's check", False)
+
+    db.session.expire_all()
+    conversations = Conversation.query.all()
+    assert len(conversations) == 1
+    conversation = conversations[0]
+    assert (conversation.gynecologist_id, conversation.patient_id) == (gynecologist_id, patient_id)
+    assert conversation.last_message_id == last_id
+    assert conversation.unread_by_gynecologist == 2
+    assert conversation.unread_by_patient == 1
+
+def test_inbox_reads_conversations_newest_first(db_client):
+    from app.models.conversation import Conversation
+    gynecologist_id, (first_patient, second_patient) = _add_gynecologist_and_patients(2)
+    _send_gynecologist_message(db_client, first_patient, gynecologist_id, "First", True)
+    _send_gynecologist_message(db_client, second_patient, gynecologist_id, "Second", True)
+    _send_gynecologist_message(db_client, first_patient, gynecologist_id, "Latest", True)
+
+    response = db_client.get('/api/gynecologist/conversations', query_string={'gynecologist_id': gynecologist_id})
+    assert response.status_code == 200
+    inbox = response.json["conversations"]
+    assert [conversation["patient_id"] for conversation in inbox] == [first_patient, second_patient]
+    assert inbox[0]["last_message"]["content"] == "Latest"
+    assert [conversation["unread_count"] for conversation in inbox] == [2, 1]
+    assert inbox[0]["pregnancy_week"] == 11
+    assert response.json["total"] == 2
+
+    # The inbox is served from the conversation table, not by aggregating messages
+    Conversation.query.filter_by(patient_id=second_patient).delete()
+    db.session.commit()
+    response = db_client.get('/api/gynecologist/conversations', query_string={'gynecologist_id': gynecologist_id})
+    assert [conversation["patient_id"] for conversation in response.json["conversations"]] == [first_patient]
+
+def test_chat_stream_ends_and_sends_each_message_once(db_client, monkeypatch):
+    from app.models.gynecologist_message import GynecologistMessage
+    from app.routes import api_routes
+    gynecologist_id, (patient_id,) = _add_gynecologist_and_patients(1)
+    # Ids need not follow timestamp order, e.g. after a clock adjustment
+    now = datetime(2025, 1, 1, 12, 0)
+    messages = [GynecologistMessage(patient_id=patient_id, gynecologist_id=gynecologist_id, content=content,
+                                    is_from_patient=True, timestamp=timestamp)
+                for content, timestamp in [("first", now), ("second", now - timedelta(minutes=1))]]
+    db.session.add_all(messages)
+    db.session.commit()
+    ids = [message.id for message in messages]
+
+    monkeypatch.setattr(api_routes, 'STREAM_MAX_SECONDS', 0.5)
+    response = db_client.get('/api/gynecologist/chat/stream',
+                             query_string={'patient_id': patient_id, 'gynecologist_id': gynecologist_id})
+    assert response.status_code == 200
+    event_ids = [int(line[len('id: '):]) for line in response.data.decode('utf-8').splitlines()
+                 if line.startswith('id: ')]
+    assert event_ids == [ids[1], ids[0]]
+
+def test_mark_chat_read_updates_unread_counts(db_client):
+    gynecologist_id, (patient_id, other_patient) = _add_gynecologist_and_patients(2)
+    first = _send_gynecologist_message(db_client, patient_id, gynecologist_id, "One", True)
+    second = _send_gynecologist_message(db_client, patient_id, gynecologist_id, "Two", True)
+    _send_gynecologist_message(db_client, other_patient, gynecologist_id, "Hi", True)
+    _send_gynecologist_message(db_client, patient_id, gynecologist_id, "Reply", False)
+
+    counts = db_client.get('/api/gynecologist/unread-counts', query_string={'gynecologist_id': gynecologist_id}).json
+    assert counts["total"] == 3
+    assert {c["patient_id"]: c["unread_count"] for c in counts["conversations"]} == {patient_id: 2, other_patient: 1}
+    assert db_client.get('/api/patient/unread-count', query_string={'patient_id': patient_id}).json == {"total": 1}
+
+    read = {"patient_id": patient_id, "gynecologist_id": gynecologist_id, "reader": "gynecologist"}
+    response = db_client.post('/api/gynecologist/chat/read', json={**read, "up_to_id": first})
+    assert response.json == {"marked": 1}
+    response = db_client.post('/api/gynecologist/chat/read', json={**read, "up_to_id": second})
+    assert response.json == {"marked": 1}
+    # Marking again is a no-op
+    assert db_client.post('/api/gynecologist/chat/read', json={**read, "up_to_id": second}).json == {"marked": 0}
+
+    counts = db_client.get('/api/gynecologist/unread-counts', query_string={'gynecologist_id': gynecologist_id}).json
+    assert counts == {"total": 1, "conversations": [{"patient_id": other_patient, "unread_count": 1}]}
+    # The gynecologist reading does not touch the patient's unread messages
+    assert db_client.get('/api/patient/unread-count', query_string={'patient_id': patient_id}).json == {"total": 1}
+
+def test_mark_chat_read_includes_messages_with_null_read(db_client):
+    from app.models.gynecologist_message import GynecologistMessage
+    gynecologist_id, (patient_id,) = _add_gynecologist_and_patients(1)
+    message_id = _send_gynecologist_message(db_client, patient_id, gynecologist_id, "Legacy", False)
+    # Rows written before read receipts existed may have read = NULL
+    GynecologistMessage.query.filter_by(id=message_id).update({GynecologistMessage.read: None})
+    db.session.commit()
+
+    response = db_client.post('/api/gynecologist/chat/read', json={
+        "patient_id": patient_id, "gynecologist_id": gynecologist_id, "reader": "patient", "up_to_id": message_id,
+    })
+    assert response.json == {"marked": 1}
+    assert db_client.get('/api/patient/unread-count', query_string={'patient_id': patient_id}).json == {"total": 0}
+    db.session.expire_all()
+    assert db.session.get(GynecologistMessage, message_id).read is True
+
+def test_mark_chat_read_rejects_unknown_reader(db_client):
+    response = db_client.post('/api/gynecologist/chat/read', json={
+        "patient_id": 1, "gynecologist_id": 2, "reader": "nurse", "up_to_id": 1,
+    })
+    assert response.status_code == 400
+
+@pytest.fixture
+def report_jobs(db_client, tmp_path, monkeypatch):
+    """db_client with report PDFs stored under tmp_path and build_report replaced by `calls` handlers."""
+    from app.services import report_generation_service, report_job_service
+    from app.utils.artifact_store import ArtifactStore
+    monkeypatch.setattr(report_generation_service, 'report_store',
+                        ArtifactStore(str(tmp_path / 'reports'), '.pdf', 10 * 1024 * 1024, 3600))
+    handlers = []
+
+    def build_report(image_bytes):
+        html_content = handlers.pop(0)(image_bytes) if handlers else f"<p>{len(image_bytes)} bytes</p>"
+        return html_content, report_generation_service.generate_pdf(html_content)
+
+    monkeypatch.setattr(report_job_service, 'build_report', build_report)
+    return db_client, handlers
+
+def _wait_for_report_job(client, job_id, statuses=('succeeded', 'failed'), timeout=10):
+    import time
+    deadline = time.monotonic() + timeout
+    while True:
+        response = client.get(f'/api/generate-report/jobs/{job_id}')
+        assert response.status_code == 200
+        if response.json["status"] in statuses or time.monotonic() > deadline:
+            return response.json
+        time.sleep(0.05)
+
+def test_report_job_runs_to_success(report_jobs):
+    import threading
+    client, handlers = report_jobs
+    release = threading.Event()
+    handlers.append(lambda image_bytes: release.wait(10) and "<h1>Report</h1><p>Normal scan.</p>")
+
+    response = client.post('/api/generate-report/jobs', data={'image': (BytesIO(b'scan'), 'scan.png')})
+    assert response.status_code == 202
+    assert response.json["status"] == "queued"
+    job_id = response.json["job_id"]
+
+    assert _wait_for_report_job(client, job_id, ('running',))["status"] == "running"
+    release.set()
+    job = _wait_for_report_job(client, job_id)
+    assert job["status"] == "succeeded"
+    assert job["attempts"] == 1
+    assert job["report"] == "<h1>Report</h1><p>Normal scan.</p>"
+    assert job["pdfLink"].endswith('.pdf')
+
+    pdf = client.get(f'/api/generate-report/jobs/{job_id}', headers={'Accept': 'application/pdf'})
+    assert pdf.mimetype == 'application/pdf'
+    assert pdf.data.startswith(b'%PDF-')
+
+def test_report_job_retries_a_failed_attempt(report_jobs):
+    client, handlers = report_jobs
+
+    def fail(image_bytes):
+        raise RuntimeError("model unavailable")
+
+    handlers.append(fail)
+    response = client.post('/api/generate-report/jobs', data={'image': (BytesIO(b'scan'), 'scan.png')})
+    job = _wait_for_report_job(client, response.json["job_id"])
+    assert job["status"] == "succeeded"
+    assert job["attempts"] == 2
+    assert job["report"] == "<p>4 bytes</p>"
+
+def test_report_job_fails_after_max_attempts(report_jobs):
+    from app.services.report_job_service import REPORT_JOB_MAX_ATTEMPTS
+    client, handlers = report_jobs
+
+    def fail(image_bytes):
+        raise RuntimeError("model unavailable")
+
+    handlers.extend([fail] * REPORT_JOB_MAX_ATTEMPTS)
+    response = client.post('/api/generate-report/jobs', data={'image': (BytesIO(b'scan'), 'scan.png')})
+    job = _wait_for_report_job(client, response.json["job_id"])
+    assert job["status"] == "failed"
+    assert job["attempts"] == REPORT_JOB_MAX_ATTEMPTS
+    assert job["error"] == "model unavailable"
+
+def test_report_job_recovers_stale_running_job(report_jobs):
+    from datetime import timezone
+    from app.models.report_job import ReportJob
+    from app.services.report_job_service import REPORT_JOB_STALE_SECONDS
+    client, _ = report_jobs
+    # A job whose worker died mid-run
+    started_at = datetime.now(timezone.utc) - timedelta(seconds=2 * REPORT_JOB_STALE_SECONDS)
+    db.session.add(ReportJob(id='stale', status='running', image=b'scan', attempts=1, started_at=started_at))
+    db.session.commit()
+
+    job = _wait_for_report_job(client, 'stale')
+    assert job["status"] == "succeeded"
+    assert job["attempts"] == 2
+
+def test_report_job_unknown_id(report_jobs):
+    client, _ = report_jobs
+    response = client.get('/api/generate-report/jobs/does-not-exist')
+    assert response.status_code == 404
+
+def test_artifact_store_keeps_the_artifact_just_written(tmp_path):
+    from app.utils.artifact_store import ArtifactStore
+    store = ArtifactStore(str(tmp_path), '.pdf', max_bytes=1000, max_age_seconds=3600)
+    store.put('small', b'x' * 600)
+    path = store.put('large', b'x' * 2000)
+    assert os.path.exists(path)
+    assert store.get('large') == path
+    assert store.get('small') is None
+
+def _blocking_batch_fn(calls, release, fail=False):
+    def batch_fn(items):
+        calls.append(list(items))
+        if len(calls) == 1:
+            release.wait(5)
+        if fail:
+            raise RuntimeError("batch failed")
+        return [item * 2 for item in items]
+    return batch_fn
+
+def _wait_until(condition):
+    import time
+    deadline = time.monotonic() + 5
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+def test_micro_batcher_batches_concurrent_submits():
+    import threading
+    from app.utils.batching import MicroBatcher
+    calls, release = [], threading.Event()
+    batcher = MicroBatcher(_blocking_batch_fn(calls, release), max_batch_size=16, max_wait_ms=5)
+    first = batcher.submit(0)
+    # Items submitted while the first batch runs are coalesced into the next one
+    _wait_until(lambda: len(calls) == 1)
+    futures = [batcher.submit(i) for i in range(1, 5)]
+    _wait_until(lambda: batcher._queue.qsize() == 4)
+    release.set()
+    assert first.result(5) == 0
+    assert [future.result(5) for future in futures] == [2, 4, 6, 8]
+    assert calls == [[0], [1, 2, 3, 4]]
+
+def test_micro_batcher_splits_at_max_batch_size():
+    import threading
+    from app.utils.batching import MicroBatcher
+    calls, release = [], threading.Event()
+    batcher = MicroBatcher(_blocking_batch_fn(calls, release), max_batch_size=2, max_wait_ms=5)
+    futures = [batcher.submit(0)]
+    _wait_until(lambda: len(calls) == 1)
+    futures += [batcher.submit(i) for i in range(1, 6)]
+    _wait_until(lambda: batcher._queue.qsize() == 5)
+    release.set()
+    assert [future.result(5) for future in futures] == [0, 2, 4, 6, 8, 10]
+    assert calls == [[0], [1, 2], [3, 4], [5]]
+
+def test_micro_batcher_sends_batch_errors_to_every_future():
+    import threading
+    from app.utils.batching import MicroBatcher
+    calls, release = [], threading.Event()
+    batcher = MicroBatcher(_blocking_batch_fn(calls, release, fail=True), max_batch_size=16, max_wait_ms=5)
+    futures = [batcher.submit(0)]
+    _wait_until(lambda: len(calls) == 1)
+    futures += [batcher.submit(i) for i in range(1, 4)]
+    _wait_until(lambda: batcher._queue.qsize() == 3)
+    release.set()
+    for future in futures:
+        with pytest.raises(RuntimeError, match="batch failed"):
+            future.result(5)
+
+def test_micro_batcher_runs_a_lone_item_without_waiting():
+    import time
+    from app.utils.batching import MicroBatcher
+    batcher = MicroBatcher(lambda items: [item * 2 for item in items], max_batch_size=16, max_wait_ms=2000)
+    start = time.monotonic()
+    assert batcher.submit(21).result(5) == 42
+    assert time.monotonic() - start < 1
+
+def test_health_tracking_batch_rejects_non_numeric_entry(test_client):
+    records = [
+        [45, 120, 80, 5.5, 37.0, 72],
+        {"age": 35, "systolic_bp": "high", "diastolic_bp": 90, "bs": 13.0, "bt": 98.0, "heart_rate": 70},
+    ]
+    response = test_client.post('/api/health-tracking/batch', json={"records": records})
+    assert response.status_code == 400
+    assert response.json["index"] == 1
+    assert "systolic_bp" in response.json["error"]
+
+    response = test_client.post('/api/health-tracking/batch', json=[[45, 120, 80, None, 37.0, 72]])
+    assert response.status_code == 400
+    assert response.json["index"] == 0
+
+def test_health_tracking_batch_accepts_lists(test_client):
+    response = test_client.post('/api/health-tracking/batch', json=[[45, 120, 80, 5.5, 37.0, 72]])
+    assert response.status_code == 200
+    assert len(response.json["results"]) == 1
+
+def test_classify_ultrasound_gif(test_client):
+    gif = BytesIO()
+    with Image.open(TEST_IMAGE_PATH) as image:
+        image.convert('P').save(gif, format='GIF')
+    gif.seek(0)
+    response = test_client.post('/api/classify-ultrasound', data={'image': (gif, 'scan.gif')})
+    assert response.status_code == 200
+    assert 'mainClassification' in response.json
+
+def test_classify_ultrasound_rejects_undecodable_image(test_client):
+    response = test_client.post('/api/classify-ultrasound', data={'image': (BytesIO(b'not an image'), 'scan.png')})
+    assert response.status_code == 400
+
+class _FakeChatCompletions:
+    """Stands in for the Groq client: replies are popped from `replies`, summaries are numbered."""
+
+    def __init__(self, replies=()):
+        from types import SimpleNamespace
+        self._namespace = SimpleNamespace
+        self.replies = list(replies)
+        self.calls = []
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, messages, model, stream=False, **kwargs):
+        self.calls.append(messages)
+        ns = self._namespace
+        if stream:
+            return self._stream(self.replies.pop(0))
+        if messages[0]["content"].startswith("Summarize"):
+            content = f"summary {sum(1 for call in self.calls if call[0]['content'].startswith('Summarize'))}"
+        else:
+            content = self.replies.pop(0) if self.replies else "reply"
+        return ns(choices=[ns(message=ns(content=content))])
+
+    def _stream(self, chunks):
+        self.stream_closed = False
+        try:
+            for chunk in chunks:
+                yield self._namespace(choices=[self._namespace(delta=self._namespace(content=chunk))])
+        finally:
+            self.stream_closed = True
+
+@pytest.fixture
+def fake_chatbot(db_client, monkeypatch):
+    from app.services import chatbot_service
+    fake = _FakeChatCompletions()
+    monkeypatch.setattr(chatbot_service, 'client', fake)
+    # One token per word keeps the budgets easy to reason about
+    monkeypatch.setattr(chatbot_service, 'count_tokens', lambda text: len(text.split()))
+    monkeypatch.setattr(chatbot_service, 'CHATBOT_CONTEXT_TOKENS', 30)
+    return fake
+
+def _save_turns(user_id, count, start=0):
+    from app.services.chatbot_service import save_exchange
+    for i in range(start, start + count):
+        save_exchange(user_id, f"question {i} a b c", f"answer {i} a b c")
+
+def test_build_context_keeps_short_history_verbatim(fake_chatbot):
+    from app.models.chat_summary import ChatSummary
+    from app.services.chatbot_service import build_context, SYSTEM_PROMPT
+    _save_turns(1, 2)
+    messages = build_context(1, "new question")
+    assert messages[0] == {"role": "system", "content": SYSTEM_PROMPT}
+    assert [m["content"] for m in messages[1:]] == [
+        "question 0 a b c", "answer 0 a b c", "question 1 a b c", "answer 1 a b c", "new question"]
+    assert ChatSummary.query.count() == 0
+    assert fake_chatbot.calls == []
+
+def test_build_context_folds_older_turns_into_summary(fake_chatbot):
+    from app.models.chat_message import ChatMessage
+    from app.models.chat_summary import ChatSummary
+    from app.services.chatbot_service import build_context
+    # 10 messages of 5 tokens each exceed the 30 token window
+    _save_turns(1, 5)
+    ids = [msg.id for msg in ChatMessage.query.order_by(ChatMessage.id)]
+
+    messages = build_context(1, "new question")
+    summary = ChatSummary.query.filter_by(user_id=1).one()
+    # The oldest messages are folded until the window is back under half the budget
+    assert summary.last_message_id == ids[6]
+    assert summary.content == "summary 1"
+    assert messages[1] == {"role": "system", "content": "Summary of the earlier conversation: summary 1"}
+    assert [m["content"] for m in messages[2:]] == [
+        "answer 3 a b c", "question 4 a b c", "answer 4 a b c", "new question"]
+    assert [m["role"] for m in messages[2:]] == ["assistant", "user", "assistant", "user"]
+
+    # Below the budget again nothing is folded
+    _save_turns(1, 1, start=5)
+    build_context(1, "another question")
+    assert ChatSummary.query.filter_by(user_id=1).one().last_message_id == ids[6]
+
+    # Past it, the next fold builds on the previous summary and advances the pointer
+    _save_turns(1, 2, start=6)
+    messages = build_context(1, "last question")
+    summary = ChatSummary.query.filter_by(user_id=1).one()
+    newest = ChatMessage.query.order_by(ChatMessage.id.desc()).limit(3).all()
+    assert summary.last_message_id > ids[6]
+    assert summary.content == "summary 2"
+    assert "Summary so far: summary 1" in fake_chatbot.calls[-1][1]["content"]
+    assert [m["content"] for m in messages[2:-1]] == [msg.content for msg in reversed(newest)
+                                                      if msg.id > summary.last_message_id]
+
+def test_chatbot_stream_saves_reply_when_finished(db_client, fake_chatbot):
+    from app.models.chat_message import ChatMessage
+    fake_chatbot.replies.append(["Hello", " there", "!"])
+    response = db_client.post('/api/chatbot/stream', json={"message": "Hi", "user_id": 1})
+    assert response.mimetype == 'text/event-stream'
+    body = response.data.decode('utf-8')
+    assert 'event: done\ndata: {"content": "Hello there!"}' in body
+    saved = [(msg.content, msg.is_bot) for msg in ChatMessage.query.order_by(ChatMessage.id)]
+    assert saved == [("Hi", False), ("Hello there!", True)]
+    assert fake_chatbot.stream_closed
+
+def test_chatbot_stream_discards_reply_when_client_disconnects(db_client, fake_chatbot):
+    from app.models.chat_message import ChatMessage
+    fake_chatbot.replies.append(["Hello", " there", "!"])
+    response = db_client.post('/api/chatbot/stream', json={"message": "Hi", "user_id": 1}, buffered=False)
+    first_event = next(response.response)
+    assert b'"content": "Hello"' in first_event
+    response.close()
+    assert fake_chatbot.stream_closed
+    assert ChatMessage.query.count() == 0
+
+def test_chat_history_pages_through_saved_exchanges(db_client):
+    from app.models.chat_message import ChatMessage
+    from app.services.chatbot_service import save_exchange
+    # Server-set timestamps from rows saved in the same second tie
+    for i in range(3):
+        save_exchange(1, f"question {i}", f"answer {i}")
+    ids = [msg.id for msg in ChatMessage.query.order_by(ChatMessage.id)]
+    assert _walk_chat_history(db_client, 1, 2) == [ids[4:6], ids[2:4], ids[0:2]]
+
+def test_other_requests_are_served_while_chat_stream_is_open(db_client, monkeypatch):
+    import http.client
+    import threading
+    from werkzeug.serving import make_server
+    from app.routes import api_routes
+    gynecologist_id, (patient_id,) = _add_gynecologist_and_patients(1)
+    monkeypatch.setattr(api_routes, 'STREAM_MAX_SECONDS', 5)
+
+    server = make_server('127.0.0.1', 0, db_client.application, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        stream = http.client.HTTPConnection('127.0.0.1', server.server_port, timeout=5)
+        stream.request('GET', f'/api/gynecologist/chat/stream?patient_id={patient_id}&gynecologist_id={gynecologist_id}')
+        stream_response = stream.getresponse()
+        assert stream_response.status == 200
+        assert stream_response.read(len(b'retry: 1000\n\n')) == b'retry: 1000\n\n'
+
+        # The open stream is idle on its own thread; other routes still answer
+        other = http.client.HTTPConnection('127.0.0.1', server.server_port, timeout=2)
+        other.request('GET', f'/api/patient/unread-count?patient_id={patient_id}')
+        other_response = other.getresponse()
+        assert other_response.status == 200
+        assert json.loads(other_response.read()) == {"total": 0}
+        other.close()
+        stream.close()
+    finally:
+        server.shutdown()
+
+def test_report_job_polling_does_not_flood_the_queue(report_jobs, monkeypatch):
+    from datetime import timezone
+    from app.models.report_job import ReportJob
+    from app.services import report_job_service
+    client, _ = report_jobs
+    enqueued = []
+    monkeypatch.setattr(report_job_service, '_recovered_pid', os.getpid())
+    monkeypatch.setattr(report_job_service, '_enqueue', enqueued.append)
+    long_ago = datetime.now(timezone.utc) - timedelta(seconds=2 * report_job_service.REPORT_JOB_STALE_SECONDS)
+    db.session.add_all([
+        # Waiting behind a busy executor: already in its queue
+        ReportJob(id='waiting', status='queued', image=b'scan', attempts=0, created_at=long_ago),
+        # Its worker went away mid-run
+        ReportJob(id='lost', status='running', image=b'scan', attempts=1, started_at=long_ago),
+    ])
+    db.session.commit()
+
+    for _ in range(3):
+        assert client.get('/api/generate-report/jobs/waiting').json["status"] == "queued"
+        assert client.get('/api/generate-report/jobs/lost').json["status"] == "running"
+    assert enqueued == ['lost']
+
+def test_artifact_store_overwrite_keeps_total_in_step(tmp_path):
+    from app.utils.artifact_store import ArtifactStore
+    store = ArtifactStore(str(tmp_path), '.pdf', max_bytes=10000, max_age_seconds=3600)
+    store.put('report', b'x' * 600)
+    store.put('report', b'x' * 400)
+    store.put('report', b'x' * 500)
+    assert store._total_bytes == 500
+
+def test_report_pdf_renders_from_cached_parse(tmp_path, monkeypatch):
+    from app.services import report_generation_service
+    from app.utils.artifact_store import ArtifactStore
+    monkeypatch.setattr(report_generation_service, 'report_store',
+                        ArtifactStore(str(tmp_path), '.pdf', 10 * 1024 * 1024, 3600))
+    parses = []
+    real_soup = report_generation_service.BeautifulSoup
+    monkeypatch.setattr(report_generation_service, 'BeautifulSoup',
+                        lambda *args, **kwargs: parses.append(1) or real_soup(*args, **kwargs))
+    report_generation_service._report_blocks.cache_clear()
+    html = "<h1>Report</h1><p>Normal scan.</p><ul><li>Follow up</li></ul>"
+
+    filename = report_generation_service.generate_pdf(html)
+    assert report_generation_service.generate_pdf(html) == filename
+    # Rendering again, e.g. after the stored PDF was evicted, reuses the parsed HTML
+    assert report_generation_service.render_pdf(html).startswith(b'%PDF-')
+    assert len(parses) == 1